@@ -1,67 +1,205 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
+import asyncio
+import json
+import os
+import threading
 import time
 from app.retrieval.retriever import Retriever
-from app.models.generator import generate_answer
+from app.models.generator import (
+    OLLAMA_MODEL,
+    build_prompt,
+    build_sources,
+    estimate_cost,
+    generate_answer_async,
+    ollama_settings,
+    stream_answer_async
+)
+from app.models.router import TIERS, route
 from app.guardrails.confidence import estimate_confidence
-from app.guardrails.refusal import should_refuse
+from app.guardrails.refusal import should_refuse, should_refuse_before_generation
 from app.logging.structured_logger import log_request
+from app.cache.semantic_cache import SemanticCache
+from app.monitoring.metrics import record_request
+from app.monitoring.tracing import Trace, current_trace, span, start_trace
 import logging
 logger = logging.getLogger("")
 
 
 router = APIRouter()
 
-# retriever
-retriever = Retriever()
+# retriever; loaded once by the warm-up in app.main's lifespan, or by the first
+# request if one arrives sooner, so importing this module stays cheap
+_retriever: Optional[Retriever] = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever() -> Retriever:
+    global _retriever
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = Retriever()
+    return _retriever
+
+
+def loaded_retriever() -> Optional[Retriever]:
+    return _retriever
+
+
+async def get_retriever_async() -> Retriever:
+    if _retriever is not None:
+        return _retriever
+    # loading takes seconds; keep the event loop serving /health meanwhile
+    return await asyncio.to_thread(get_retriever)
+
+# semantic answer cache
+answer_cache = SemanticCache()
+
+# Smoothing factor for the running generation latency used to price skipped LLM calls
+GENERATION_LATENCY_ALPHA = 0.1
+
+class GenerationLatencyTracker:
+    """
+    Exponential moving average of real generation latency, used to estimate
+    how many generation-seconds the pre-generation gate saves.
+    """
+
+    def __init__(self, alpha: float = GENERATION_LATENCY_ALPHA):
+        self.alpha = alpha
+        self.average_seconds = None
+
+    def observe(self, seconds: float):
+        if self.average_seconds is None:
+            self.average_seconds = seconds
+        else:
+            self.average_seconds += self.alpha * (seconds - self.average_seconds)
+
+    def estimate(self) -> float:
+        return round(self.average_seconds or 0.0, 3)
+
+generation_tracker = GenerationLatencyTracker()
+
+# Typical generation time of each model tier, so the router can tell whether
+# the large model fits in what is left of a request's latency budget
+tier_trackers = {tier: GenerationLatencyTracker() for tier in TIERS}
+
+# Upper bounds for /query/batch so one caller cannot monopolise Ollama
+BATCH_MAX_QUESTIONS = int(os.getenv("VERIFAI_BATCH_MAX_QUESTIONS", "1000"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("VERIFAI_BATCH_MAX_CONCURRENCY", "4"))
 
 class QueryRequest(BaseModel):
     question: str
     top_k: int = 3
+    # end-to-end target; the router picks a faster model tier when needed to meet it
+    latency_budget_ms: Optional[int] = None
 
-@router.post("/query")
-def query_rag(request: QueryRequest):
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    top_k: int = 3
+    concurrency: int = BATCH_MAX_CONCURRENCY
+    # applied to each question
+    latency_budget_ms: Optional[int] = None
 
-    if not request.question.strip():
-        raise HTTPException(status_code=400, detail="Question cannot be empty")
 
-    # retrieval
-    retrieval_start = time.time()
+async def retrieve_with_cache(request: QueryRequest):
+    """
+    Embed the question once and use it both for the cache lookup and,
+    on a miss, for the Chroma query.
+    """
     try:
-        retrieved_chunks = retriever.retrieve(
-            query=request.question,
-            top_k=request.top_k
-        )
+        retriever = await get_retriever_async()
+        with span("embed"):
+            query_embedding = await retriever.embed_async(request.question)
+        with span("cache_lookup") as attributes:
+            index_version = retriever.index_version()
+            cached = answer_cache.get(query_embedding, request.top_k, index_version)
+            attributes["hit"] = cached is not None
+        if cached is not None:
+            retrieved_chunks = cached["retrieved_chunks"]
+        else:
+            with span("search"):
+                retrieved_chunks = await retriever.search_async(
+                    query_embedding=query_embedding,
+                    top_k=request.top_k,
+                    query=request.question
+                )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Retrieval error: {str(e)}")
-    retrieval_latency = round((time.time() - retrieval_start)*1000)
 
-    # generation
-    generation_start = time.time()
-    result = generate_answer(
-        query=request.question,
-        retrieved_chunks=retrieved_chunks
+    return query_embedding, index_version, cached, retrieved_chunks
+
+
+def choose_tier(request: QueryRequest, retrieved_chunks, retrieval_latency: int) -> dict:
+    remaining_budget_ms = None
+    if request.latency_budget_ms is not None:
+        remaining_budget_ms = request.latency_budget_ms - retrieval_latency
+    return route(
+        retrieved_chunks,
+        remaining_budget_ms,
+        {tier: tracker.estimate() * 1000 for tier, tracker in tier_trackers.items()},
+        get_retriever().cosine
     )
-    generation_latency = round((time.time() - generation_start)*1000)
 
-    # Add total latency (retrieval latency + generation latency)
-    total_latency = retrieval_latency + generation_latency
 
-    confidence = estimate_confidence(retrieved_chunks, result["answer"])
+def finalize_response(
+    request: QueryRequest,
+    retrieved_chunks,
+    result: dict,
+    confidence: float,
+    latency_ms: dict,
+    cache_hit: bool,
+    cache_key: tuple,
+    endpoint: str = "/query"
+) -> dict:
+    """
+    Apply the refusal guardrail, cache, log and record metrics for the request
+    and build the API response.
+    """
+    gated = should_refuse_before_generation(retrieved_chunks, get_retriever().cosine)
+    refused = gated or should_refuse(confidence, retrieved_chunks, get_retriever().cosine)
 
-    refused = should_refuse(confidence, retrieved_chunks)
+    # a gated request never reached the LLM; count what that call would have cost
+    generation_seconds_saved = generation_tracker.estimate() if gated and not cache_hit else 0.0
+    # which model tier generated this answer; cached answers were generated earlier
+    routing = None if cache_hit else result.get("routing")
+    if not cache_hit and not gated and "reason" not in result:
+        generation_tracker.observe(latency_ms["generation"] / 1000)
+        if routing is not None:
+            tier_trackers[routing["tier"]].observe(latency_ms["generation"] / 1000)
 
-    if refused:
+    # LLM errors are transient, so only cache real answers and refusals
+    if not cache_hit and "reason" not in result:
+        query_embedding, index_version = cache_key
+        answer_cache.put(query_embedding, request.top_k, index_version, {
+            "retrieved_chunks": retrieved_chunks,
+            "result": result,
+            "confidence": confidence
+        })
+
+    if gated:
+        outcome = "REFUSED_PRE_GENERATION"
+        refusal_reason = "INSUFFICIENT_POLICY_GROUNDING"
+    elif refused:
         outcome = "REFUSED_NO_STRONG_RETRIEVAL"
         refusal_reason = "INSUFFICIENT_POLICY_GROUNDING"
     else:
         outcome = "ANSWERED"
         refusal_reason = None
 
+    # a cache hit reuses an earlier generation and costs nothing
+    usage = None if cache_hit else result.get("usage")
+    context = None if cache_hit else result.get("context")
+    cost = estimate_cost(usage)
+    trace = current_trace()
+
     log_request({
         "query": request.question,
         "retrieval": {
             "top_k": request.top_k,
+            **get_retriever().retrieval_info(),
             "retrieved_docs": [
                 {
                     "chunk_id": meta.get("chunk_id"),
@@ -73,18 +211,38 @@ def query_rag(request: QueryRequest):
         "generation": {
             "model": result["model_used"],
             "answer": None if refused else result["answer"],
-            "refusal_reason": refusal_reason
+            "refusal_reason": refusal_reason,
+            "usage": usage,
+            "context": context,
+            "ollama": None if cache_hit else result.get("ollama"),
+            "routing": routing
         },
         "confidence": None if refused else confidence,
-        "latency_ms": {
-            "retrieval": retrieval_latency,
-            "generation": generation_latency,
-            "total": total_latency
+        "latency_ms": latency_ms,
+        "cache_hit": cache_hit,
+        "gate": {
+            "refused_pre_generation": gated,
+            "generation_seconds_saved": generation_seconds_saved
         },
-        "cost": 0.0,
-        "outcome": outcome
+        "cost": cost,
+        "outcome": outcome,
+        "trace": trace.spans() if trace is not None else None
     })
 
+    record_request(
+        endpoint,
+        outcome,
+        refusal_reason,
+        latency_ms,
+        confidence_value=None if refused else confidence,
+        cache_hit=cache_hit,
+        llm_error="reason" in result,
+        usage=usage,
+        cost=cost,
+        context=context,
+        tier=routing["tier"] if routing is not None else None
+    )
+
     if refused:
         return {
             "answer": None,
@@ -92,7 +250,7 @@ def query_rag(request: QueryRequest):
             "sources": result["sources"],
             "model_used": result["model_used"],
             "confidence": None,
-            "latency": total_latency
+            "latency": latency_ms["total"]
         }
 
     return {
@@ -100,5 +258,295 @@ def query_rag(request: QueryRequest):
         "sources": result["sources"],
         "model_used": result["model_used"],
         "confidence": confidence,
-        "latency": total_latency
-    }
\ No newline at end of file
+        "latency": latency_ms["total"]
+    }
+
+
+@router.post("/query")
+async def query_rag(request: QueryRequest, response: Response):
+
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+    trace = start_trace()
+
+    # retrieval
+    retrieval_start = time.time()
+    with span("retrieval"):
+        query_embedding, index_version, cached, retrieved_chunks = await retrieve_with_cache(request)
+    retrieval_latency = round((time.time() - retrieval_start)*1000)
+
+    result = await answer_question(
+        request,
+        retrieved_chunks,
+        cached,
+        retrieval_latency,
+        cache_key=(query_embedding, index_version)
+    )
+    response.headers["Server-Timing"] = trace.server_timing()
+    return result
+
+
+def skipped_generation_result(retrieved_chunks) -> dict:
+    return {
+        "answer": None,
+        "sources": build_sources(retrieved_chunks),
+        "model_used": OLLAMA_MODEL
+    }
+
+
+async def answer_question(
+    request: QueryRequest,
+    retrieved_chunks,
+    cached,
+    retrieval_latency: int,
+    cache_key: tuple,
+    endpoint: str = "/query"
+) -> dict:
+    cache_hit = cached is not None
+
+    # generation (skipped when a near-duplicate question was already answered,
+    # or when retrieval alone already rules out a grounded answer)
+    generation_start = time.time()
+    with span("generation") as attributes:
+        if cache_hit:
+            attributes["path"] = "cache"
+            result = cached["result"]
+            confidence = cached["confidence"]
+        elif should_refuse_before_generation(retrieved_chunks, get_retriever().cosine):
+            attributes["path"] = "gated"
+            result = skipped_generation_result(retrieved_chunks)
+            confidence = 0.0
+        else:
+            attributes["path"] = "llm"
+            routing = choose_tier(request, retrieved_chunks, retrieval_latency)
+            attributes["tier"] = routing["tier"]
+            result = await generate_answer_async(
+                query=request.question,
+                retrieved_chunks=retrieved_chunks,
+                model_tier=routing["model"]
+            )
+            result["routing"] = routing
+            with span("confidence"):
+                confidence = estimate_confidence(retrieved_chunks, result["answer"], get_retriever().cosine)
+    generation_latency = round((time.time() - generation_start)*1000)
+
+    # Add total latency (retrieval latency + generation latency)
+    total_latency = retrieval_latency + generation_latency
+
+    return finalize_response(
+        request,
+        retrieved_chunks,
+        result,
+        confidence,
+        latency_ms={
+            "retrieval": retrieval_latency,
+            "generation": generation_latency,
+            "total": total_latency
+        },
+        cache_hit=cache_hit,
+        cache_key=cache_key,
+        endpoint=endpoint
+    )
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/query/stream")
+async def query_rag_stream(request: QueryRequest):
+    """
+    Server-Sent Events variant of /query: `token` events carry the answer as
+    Ollama produces it, and a final `done` event carries the same payload /query
+    returns, including the refusal decision. Clients must discard the streamed
+    text when the final event reports a refusal.
+    """
+
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+    trace = start_trace()
+
+    # retrieval happens before the stream opens so errors still map to HTTP codes
+    retrieval_start = time.time()
+    with span("retrieval"):
+        query_embedding, index_version, cached, retrieved_chunks = await retrieve_with_cache(request)
+    retrieval_latency = round((time.time() - retrieval_start)*1000)
+    cache_hit = cached is not None
+
+    async def event_stream():
+        # the body is produced in another task, so carry the trace over explicitly
+        start_trace(trace)
+        generation_start = time.time()
+        ttft_latency = None
+
+        if cache_hit:
+            result = cached["result"]
+            confidence = cached["confidence"]
+            if result["answer"] and not should_refuse(confidence, retrieved_chunks, get_retriever().cosine):
+                ttft_latency = round((time.time() - generation_start)*1000)
+                yield sse_event("token", {"token": result["answer"]})
+        elif should_refuse_before_generation(retrieved_chunks, get_retriever().cosine):
+            result = skipped_generation_result(retrieved_chunks)
+            confidence = 0.0
+        else:
+            routing = choose_tier(request, retrieved_chunks, retrieval_latency)
+            model = routing["model"]
+            with span("build_prompt") as attributes:
+                prompt, sources, packing = build_prompt(request.question, retrieved_chunks)
+                settings = ollama_settings(prompt)
+                attributes["tokens_saved"] = packing["tokens_saved"]
+            tokens = []
+            usage = {}
+            llm_start = time.perf_counter()
+            try:
+                async for token in stream_answer_async(prompt, model, usage=usage, settings=settings):
+                    if ttft_latency is None:
+                        ttft_latency = round((time.time() - generation_start)*1000)
+                    tokens.append(token)
+                    yield sse_event("token", {"token": token})
+
+                answer_text = "".join(tokens).strip()
+                if not answer_text:
+                    answer_text = "I do not have enough information in the provided context."
+                result = {
+                    "answer": answer_text,
+                    "sources": sources,
+                    "model_used": model,
+                    "usage": usage,
+                    "context": packing,
+                    "ollama": settings,
+                    "routing": routing
+                }
+            except Exception as e:
+                logger.error(f"Ollama error: {e}")
+                result = {
+                    "answer": None,
+                    "sources": sources,
+                    "model_used": model,
+                    "reason": f"LLM error: {str(e)}",
+                    "context": packing,
+                    "ollama": settings,
+                    "routing": routing
+                }
+            # spans cannot be held open across yields, so the LLM span is recorded directly
+            trace.record(
+                "llm_call", None, llm_start, time.perf_counter(),
+                {"model": model, "num_ctx": settings["num_ctx"]}
+            )
+            confidence = estimate_confidence(retrieved_chunks, result["answer"], get_retriever().cosine)
+
+        generation_latency = round((time.time() - generation_start)*1000)
+        total_latency = retrieval_latency + generation_latency
+
+        response = finalize_response(
+            request,
+            retrieved_chunks,
+            result,
+            confidence,
+            latency_ms={
+                "retrieval": retrieval_latency,
+                "generation": generation_latency,
+                "ttft": ttft_latency,
+                "total": total_latency
+            },
+            cache_hit=cache_hit,
+            cache_key=(query_embedding, index_version),
+            endpoint="/query/stream"
+        )
+        yield sse_event("done", response)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@router.post("/query/batch")
+async def query_rag_batch(request: BatchQueryRequest):
+    """
+    Answer many questions in one call. All questions are embedded in one batched
+    encode and cache misses are retrieved with a single multi-query Chroma call;
+    generation then fans out to Ollama with bounded parallelism. Results are
+    streamed as JSONL in completion order, each tagged with its input `index`.
+    The logged retrieval latency is the batch retrieval time amortised per question;
+    each question's trace carries the whole batch retrieval as its `retrieval` span.
+    """
+
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="Questions cannot be empty")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch"
+        )
+
+    items = [
+        QueryRequest(question=q, top_k=request.top_k, latency_budget_ms=request.latency_budget_ms)
+        for q in request.questions
+    ]
+    valid = [i for i, r in enumerate(items) if r.question.strip()]
+
+    # retrieval
+    retrieval_start = time.time()
+    retrieval_span_start = time.perf_counter()
+    try:
+        retriever = await get_retriever_async()
+        embeddings = await retriever.embed_batch_async([items[i].question for i in valid])
+        index_version = retriever.index_version()
+
+        query_embeddings = dict(zip(valid, embeddings))
+        cached = {
+            i: answer_cache.get(query_embeddings[i], request.top_k, index_version)
+            for i in valid
+        }
+        misses = [i for i in valid if cached[i] is None]
+        searched = await retriever.search_batch_async(
+            [query_embeddings[i] for i in misses],
+            top_k=request.top_k,
+            queries=[items[i].question for i in misses]
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Retrieval error: {str(e)}")
+
+    retrieved = dict(zip(misses, searched))
+    for i in valid:
+        if cached[i] is not None:
+            retrieved[i] = cached[i]["retrieved_chunks"]
+    retrieval_span_end = time.perf_counter()
+    retrieval_latency = round((time.time() - retrieval_start)*1000 / max(len(valid), 1))
+
+    semaphore = asyncio.Semaphore(max(1, min(request.concurrency, BATCH_MAX_CONCURRENCY)))
+
+    async def answer(i: int) -> dict:
+        if i not in query_embeddings:
+            return {"index": i, "error": "Question cannot be empty"}
+
+        # each task runs in its own context, so every question gets its own trace;
+        # it starts with the shared batch retrieval the question waited on
+        trace = start_trace(Trace(start=retrieval_span_start))
+        trace.record(
+            "retrieval", None, retrieval_span_start, retrieval_span_end,
+            {"batch_size": len(valid), "searched": len(misses)}
+        )
+
+        async with semaphore:
+            response = await answer_question(
+                items[i],
+                retrieved[i],
+                cached[i],
+                retrieval_latency,
+                cache_key=(query_embeddings[i], index_version),
+                endpoint="/query/batch"
+            )
+        return {"index": i, "question": items[i].question, **response}
+
+    async def jsonl_stream():
+        tasks = [asyncio.create_task(answer(i)) for i in range(len(items))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # client went away: stop generating answers nobody will read
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(jsonl_stream(), media_type="application/x-ndjson")
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Cosine similarity above which two questions are treated as the same question
+CACHE_SIMILARITY_THRESHOLD = float(os.getenv("VERIFAI_CACHE_THRESHOLD", "0.95"))
+CACHE_MAX_ENTRIES = int(os.getenv("VERIFAI_CACHE_MAX_ENTRIES", "512"))
+CACHE_TTL_SECONDS = float(os.getenv("VERIFAI_CACHE_TTL_SECONDS", "3600"))
+
+
+class SemanticCache:
+    """
+    LRU + TTL cache of final query results, keyed on the query embedding.
+
+    A lookup hits when a stored question has cosine similarity >= threshold
+    with the incoming one and was answered with the same top_k against the
+    same index version.
+    """
+
+    def __init__(
+        self,
+        threshold: float = CACHE_SIMILARITY_THRESHOLD,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        ttl_seconds: float = CACHE_TTL_SECONDS
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._index_version = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, index_version):
+        # A rebuilt collection makes every stored answer suspect
+        if index_version != self._index_version:
+            self._entries.clear()
+            self._index_version = index_version
+
+    def _evict_expired(self, now: float):
+        expired = [
+            key for key, entry in self._entries.items()
+            if now - entry["created_at"] > self.ttl_seconds
+        ]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, embedding: List[float], top_k: int, index_version) -> Optional[Dict]:
+        vector = self._normalize(embedding)
+
+        with self._lock:
+            self._check_version(index_version)
+            self._evict_expired(time.time())
+
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if entry["top_k"] == top_k
+            ]
+            if not candidates:
+                self.misses += 1
+                return None
+
+            matrix = np.stack([entry["embedding"] for _, entry in candidates])
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["value"]
+
+    def put(self, embedding: List[float], top_k: int, index_version, value: Dict):
+        vector = self._normalize(embedding)
+
+        with self._lock:
+            self._check_version(index_version)
+
+            self._entries[self._next_key] = {
+                "embedding": vector,
+                "top_k": top_k,
+                "created_at": time.time(),
+                "value": value
+            }
+            self._next_key += 1
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -1,6 +1,6 @@
 # app/guardrails/confidence.py
 
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
 import re
 
 REFUSAL_PATTERNS = [
@@ -10,14 +10,67 @@ REFUSAL_PATTERNS = [
     "no information is available",
 ]
 
+# Weights of the confidence components
+COVERAGE_WEIGHT = 0.30
+SIMILARITY_WEIGHT = 0.30
+LENGTH_WEIGHT = 0.20
+CITATION_WEIGHT = 0.20
+
 def is_refusal(answer_text: str) -> bool:
     answer_lower = answer_text.lower()
     return any(p in answer_lower for p in REFUSAL_PATTERNS)
 
 
+def retrieval_scores(
+    retrieved_chunks: List[tuple],
+    cosine: Optional[Callable[[float], float]] = None
+) -> Dict[str, float]:
+    """
+    Confidence components that depend only on retrieval, so they are known
+    before the LLM is called. `cosine` maps the retriever's scores to cosine
+    similarity (Retriever.cosine); without it they are taken as cosine already.
+    """
+
+    # 1. Retrieval coverage
+    k = len(retrieved_chunks)
+    coverage_score = min(k / 3, 1.0)  # saturates at 3 chunks
+
+    # 2. Similarity strength
+    scores = [cosine(score) if cosine else score for _, score, _ in retrieved_chunks]
+    avg_similarity = sum(scores) / len(scores)
+
+    # Normalize assuming cosine similarity ~ [0.3, 0.8]
+    similarity_score = min(max((avg_similarity - 0.3) / 0.5, 0), 1)
+
+    return {"coverage": coverage_score, "similarity": similarity_score}
+
+
+def max_attainable_confidence(
+    retrieved_chunks: List[tuple],
+    cosine: Optional[Callable[[float], float]] = None
+) -> float:
+    """
+    Best confidence estimate_confidence could return for these chunks,
+    i.e. assuming a well-sized answer that cites every chunk.
+    """
+
+    if not retrieved_chunks:
+        return 0.0
+
+    scores = retrieval_scores(retrieved_chunks, cosine)
+    return round(
+        COVERAGE_WEIGHT * scores["coverage"] +
+        SIMILARITY_WEIGHT * scores["similarity"] +
+        LENGTH_WEIGHT +
+        CITATION_WEIGHT,
+        3
+    )
+
+
 def estimate_confidence(
     retrieved_chunks: List[tuple],
-    answer_text: str
+    answer_text: str,
+    cosine: Optional[Callable[[float], float]] = None
 ) -> float:
     """
     Estimate confidence ∈ [0, 1] based on retrieval + answer quality.
@@ -29,16 +82,9 @@ def estimate_confidence(
     if is_refusal(answer_text): # in the case where there is explicit refusal from the LLM
         return 0.0
 
-    # 1. Retrieval coverage
+    # 1 + 2. Retrieval coverage and similarity strength
+    scores = retrieval_scores(retrieved_chunks, cosine)
     k = len(retrieved_chunks)
-    coverage_score = min(k / 3, 1.0)  # saturates at 3 chunks
-
-    # 2. Similarity strength
-    scores = [score for _, score, _ in retrieved_chunks]
-    avg_similarity = sum(scores) / len(scores)
-
-    # Normalize assuming cosine similarity ~ [0.3, 0.8]
-    similarity_score = min(max((avg_similarity - 0.3) / 0.5, 0), 1)
 
     # 3. Answer vs context length
     context_len = sum(len(chunk) for chunk, _, _ in retrieved_chunks)
@@ -54,10 +100,10 @@ def estimate_confidence(
 
     # Weighted combination
     confidence = (
-        0.30 * coverage_score +
-        0.30 * similarity_score +
-        0.20 * length_score +
-        0.20 * citation_score
+        COVERAGE_WEIGHT * scores["coverage"] +
+        SIMILARITY_WEIGHT * scores["similarity"] +
+        LENGTH_WEIGHT * length_score +
+        CITATION_WEIGHT * citation_score
     )
 
     return round(confidence, 3)
@@ -1,22 +1,43 @@
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
+from app.guardrails.confidence import max_attainable_confidence
 
 MIN_CONFIDENCE = 0.4
+# Cosine similarity of the best chunk, whichever retriever backend scored it
 MIN_SIMILARITY = 0.4
 
+def should_refuse_before_generation(
+    retrieved_chunks: List[tuple],
+    cosine: Optional[Callable[[float], float]] = None) -> bool:
+    """
+    Retrieval-only stage: True when no answer could pass should_refuse,
+    so the LLM call can be skipped entirely. `cosine` maps the retriever's
+    scores to cosine similarity (Retriever.cosine).
+    """
+
+    if not retrieved_chunks:
+        return True
+
+    # No strong retrieval signal
+    max_similarity = max(cosine(score) if cosine else score for _, score, _ in retrieved_chunks)
+    if max_similarity < MIN_SIMILARITY:
+        return True
+
+    # Even a perfect answer could not reach the confidence floor
+    if max_attainable_confidence(retrieved_chunks, cosine) < MIN_CONFIDENCE:
+        return True
+
+    return False
+
 def should_refuse(
     confidence: float,
-    retrieved_chunks: List[tuple]) -> bool:
+    retrieved_chunks: List[tuple],
+    cosine: Optional[Callable[[float], float]] = None) -> bool:
 
-    if not retrieved_chunks:
+    if should_refuse_before_generation(retrieved_chunks, cosine):
         return True
 
     # Low overall confidence
     if confidence < MIN_CONFIDENCE:
         return True
 
-    # No strong retrieval signal
-    max_similarity = max(score for _, score, _ in retrieved_chunks)
-    if max_similarity < MIN_SIMILARITY:
-        return True
-
     return False
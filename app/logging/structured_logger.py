@@ -1,13 +1,263 @@
+import atexit
+import gzip
 import json
+import os
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:
+    # no flock (Windows); fine for a single server process
+    fcntl = None
+
 LOG_PATH = Path("logs/requests.jsonl")
 LOG_PATH.parent.mkdir(exist_ok=True)
 
+# Records waiting for the writer; beyond this, new records are dropped rather than blocking requests
+LOG_QUEUE_SIZE = int(os.getenv("VERIFAI_LOG_QUEUE_SIZE", "10000"))
+# A batch is written once it has this many records or its oldest record is this old
+LOG_FLUSH_RECORDS = int(os.getenv("VERIFAI_LOG_FLUSH_RECORDS", "100"))
+LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv("VERIFAI_LOG_FLUSH_INTERVAL_SECONDS", "1.0"))
+# The active file is rotated when it exceeds this size or the UTC date changes
+LOG_ROTATE_BYTES = int(os.getenv("VERIFAI_LOG_ROTATE_BYTES", str(64 * 1024 * 1024)))
+LOG_COMPRESS_ROTATED = os.getenv("VERIFAI_LOG_COMPRESS_ROTATED", "1") == "1"
+
+_STOP = object()
+
+
+def rotated_segments(path: Path = LOG_PATH):
+    """
+    Rotated segments of `path`, oldest first. Names embed the rotation time,
+    so lexical order is chronological.
+    """
+    return sorted(path.parent.glob(f"{path.stem}.*{path.suffix}*"))
+
+
+class BackgroundLogWriter:
+    """
+    Moves structured-log disk I/O off the request path.
+
+    log_request only enqueues; a daemon thread batches records to disk,
+    rotates the active file by size and date, optionally gzips rotated
+    segments, and drains the queue on shutdown.
+
+    Several worker processes may share the file. Each write and each rotation
+    holds an exclusive flock on a sidecar lock file, and a writer re-checks
+    which inode the path names before writing, so no worker appends to a
+    segment another one has already renamed and is compressing.
+    """
+
+    def __init__(
+        self,
+        path: Path = LOG_PATH,
+        queue_size: int = LOG_QUEUE_SIZE,
+        flush_records: int = LOG_FLUSH_RECORDS,
+        flush_interval: float = LOG_FLUSH_INTERVAL_SECONDS,
+        rotate_bytes: int = LOG_ROTATE_BYTES,
+        compress_rotated: bool = LOG_COMPRESS_ROTATED
+    ):
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(f"{self.path.name}.lock")
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.compress_rotated = compress_rotated
+        self.queue_size = queue_size
+        self._closed = False
+
+        self._start()
+        # threads do not survive fork (gunicorn --preload), so each worker starts its own
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        # a handle inherited from the parent is dropped unflushed; the parent owns its buffer
+        self._file = None
+        self._segment_date = None
+        # flock is held per open file, so each process opens its own
+        self._lock_file = None
+        self._stats_lock = threading.Lock()
+
+        self.dropped = 0
+        self.written = 0
+        self.rotations = 0
+
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, payload: dict) -> bool:
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(payload)
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.flush_records:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._write(batch)
+            if stop:
+                break
+
+        # drain whatever was enqueued before shutdown
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                remaining.append(item)
+        if remaining:
+            self._write(remaining)
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    @contextmanager
+    def _exclusive(self):
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            self._lock_file = open(self.lock_path, "a")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        stat = os.fstat(self._file.fileno())
+        if stat.st_size:
+            self._segment_date = datetime.fromtimestamp(stat.st_mtime, timezone.utc).date()
+        else:
+            self._segment_date = datetime.now(timezone.utc).date()
+
+    def _ensure_open(self):
+        if self._file is None:
+            self._open()
+            return
+
+        # another worker process may have rotated the file under us
+        try:
+            same_file = os.stat(self.path).st_ino == os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            same_file = False
+        if not same_file:
+            self._file.close()
+            self._open()
+
+    def _should_rotate(self) -> bool:
+        # the file's size, including what other workers appended
+        size = os.fstat(self._file.fileno()).st_size
+        if not size:
+            return False
+        return (
+            size >= self.rotate_bytes
+            or datetime.now(timezone.utc).date() != self._segment_date
+        )
+
+    def _rotate(self) -> Path:
+        # called under the lock; returns the renamed segment
+        self._file.close()
+        self._file = None
+
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        rotated = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}")
+        os.replace(self.path, rotated)
+
+        with self._stats_lock:
+            self.rotations += 1
+        self._open()
+        return rotated
+
+    def _compress(self, rotated: Path):
+        with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        rotated.unlink()
+
+    def _write(self, batch):
+        lines = "".join(json.dumps(payload) + "\n" for payload in batch)
+        rotated = None
+        try:
+            with self._exclusive():
+                self._ensure_open()
+                if self._should_rotate():
+                    rotated = self._rotate()
+                self._file.write(lines)
+                self._file.flush()
+        except OSError:
+            with self._stats_lock:
+                self.dropped += len(batch)
+            return
+
+        with self._stats_lock:
+            self.written += len(batch)
+
+        # nobody writes to the renamed segment any more, so this needs no lock
+        if rotated is not None and self.compress_rotated:
+            try:
+                self._compress(rotated)
+            except OSError:
+                # the plain segment stays readable
+                pass
+
+    def close(self, timeout: float = 10.0):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "queued": self._queue.qsize(),
+                "written": self.written,
+                "dropped": self.dropped,
+                "rotations": self.rotations
+            }
+
+
+log_writer = BackgroundLogWriter()
+atexit.register(log_writer.close)
+
+
 def log_request(payload: dict):
     payload["timestamp"] = datetime.now(timezone.utc).isoformat(timespec='milliseconds')
-    
-    with open(LOG_PATH, "a") as f:
-        f.write(json.dumps(payload) + "\n")
-        f.flush()
\ No newline at end of file
+    log_writer.enqueue(payload)
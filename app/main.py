@@ -1,10 +1,200 @@
-from fastapi import FastAPI
-from app.api.query import router as query_router
+import asyncio
+import gc
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from app.api.query import router as query_router, get_retriever, loaded_retriever
+from app.retrieval.embedding_backend import EMBEDDING_BACKEND
+from app.models.generator import close_async_client, get_async_client, ollama_pool, preload_model_async
+from app.models.router import TIERS
+from app.logging.structured_logger import log_writer
+from app.monitoring import metrics
 
-app = FastAPI(title = 'VerifAI')
+logger = logging.getLogger("uvicorn.error")
+
+# Cold-start time is measured from here, the earliest point the app controls
+STARTED_AT = time.perf_counter()
+
+# Load and exercise the embedding model and index before reporting ready
+WARMUP_ENABLED = os.getenv("VERIFAI_WARMUP", "1") == "1"
+# Also ask Ollama to load the model (kept resident for VERIFAI_OLLAMA_KEEP_ALIVE)
+WARMUP_OLLAMA = os.getenv("VERIFAI_WARMUP_OLLAMA", "0") == "1"
+
+# Load the model and index at import time. Under gunicorn --preload that import
+# happens once in the master, so forked workers share the pages copy-on-write
+PRELOAD_MODEL = os.getenv("VERIFAI_PRELOAD_MODEL", "0") == "1"
+
+# A single query and a small batch, so both encode paths are exercised
+WARMUP_QUERIES = ["What is the intern leave policy?"] * 8
+
+startup_state = {
+    "ready": False,
+    "cold_start_seconds": None,
+    "stages_seconds": {},
+    "error": None
+}
+
+
+def warm_up_retriever(stages: dict):
+    start = time.perf_counter()
+    retriever = get_retriever()
+    stages["load_retriever"] = round(time.perf_counter() - start, 3)
+
+    # bypass the embedding cache, which would skip the model entirely
+    start = time.perf_counter()
+    retriever.model.encode(WARMUP_QUERIES[:1])
+    embeddings = retriever.model.encode(WARMUP_QUERIES).tolist()
+    stages["warmup_encode"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    retriever.search_batch(embeddings[:1], top_k=3, queries=WARMUP_QUERIES[:1])
+    stages["warmup_search"] = round(time.perf_counter() - start, 3)
+
+
+async def warm_up():
+    stages = startup_state["stages_seconds"]
+    try:
+        if WARMUP_ENABLED:
+            await asyncio.to_thread(warm_up_retriever, stages)
+
+        if WARMUP_OLLAMA:
+            start = time.perf_counter()
+            startup_state["ollama"] = []
+            # every model the router may pick
+            for model in dict.fromkeys(model for model in TIERS.values() if model):
+                try:
+                    startup_state["ollama"].append(await preload_model_async(model))
+                except Exception as e:
+                    # Ollama may come up later; requests will load the model then
+                    logger.warning(f"Ollama pre-load of {model} failed: {e}")
+                    startup_state["ollama"].append({"model": model, "error": str(e)})
+            stages["ollama_preload"] = round(time.perf_counter() - start, 3)
+
+        startup_state["ready"] = True
+    except Exception as e:
+        logger.exception("Warm-up failed")
+        startup_state["error"] = str(e)
+
+    cold_start = round(time.perf_counter() - STARTED_AT, 3)
+    startup_state["cold_start_seconds"] = cold_start
+    metrics.cold_start_seconds.set(cold_start)
+    metrics.ready.set(1 if startup_state["ready"] else 0)
+    logger.info(f"Cold start finished in {cold_start}s (ready={startup_state['ready']}, stages={stages})")
+
+
+def preload_retriever():
+    # onnxruntime sessions own thread pools that do not survive fork; each
+    # worker builds its own session (the int8 model is small) instead
+    if EMBEDDING_BACKEND == "onnx":
+        logger.warning("VERIFAI_PRELOAD_MODEL is ignored for the onnx embedding backend")
+        return
+
+    start = time.perf_counter()
+    # load only: running inference before fork can leave OpenMP unusable in workers
+    get_retriever()
+    startup_state["stages_seconds"]["preload_retriever"] = round(time.perf_counter() - start, 3)
+
+    # keep the garbage collector from touching (and so copying) the preloaded objects
+    gc.freeze()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # warm up in the background so /health answers while the model loads
+    warmup_task = asyncio.create_task(warm_up())
+    # eject and re-admit Ollama backends between requests, not only on failures
+    ollama_pool.start_probes(get_async_client)
+    yield
+    warmup_task.cancel()
+    ollama_pool.stop_probes()
+    # release pooled Ollama connections and the embedding workers
+    await close_async_client()
+    retriever = loaded_retriever()
+    if retriever is not None:
+        retriever.close()
+    # flush buffered request logs before the process exits
+    log_writer.close()
+
+
+app = FastAPI(title = 'VerifAI', lifespan=lifespan)
+
+if PRELOAD_MODEL:
+    preload_retriever()
+
+# Endpoints whose concurrency is exported as verifai_requests_in_flight
+IN_FLIGHT_ENDPOINTS = ("/query", "/query/stream", "/query/batch")
+
+
+@app.middleware("http")
+async def track_in_flight(request: Request, call_next):
+    endpoint = request.url.path
+    if endpoint not in IN_FLIGHT_ENDPOINTS:
+        return await call_next(request)
+
+    metrics.in_flight.inc(endpoint=endpoint)
+    try:
+        response = await call_next(request)
+    except Exception:
+        metrics.in_flight.dec(endpoint=endpoint)
+        raise
+
+    # streamed responses stay in flight until their body is fully sent
+    body_iterator = response.body_iterator
+
+    async def tracked_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            metrics.in_flight.dec(endpoint=endpoint)
+
+    response.body_iterator = tracked_body()
+    return response
 
 @app.get("/health")
 def health_check():
+    # liveness only; see /ready for whether the model is loaded and warm
     return {"status":"ok"}
 
-app.include_router(query_router)
\ No newline at end of file
+@app.get("/ready")
+def readiness_check():
+    return JSONResponse(startup_state, status_code=200 if startup_state["ready"] else 503)
+
+@app.get("/stats/embedding")
+def embedding_stats():
+    retriever = get_retriever()
+    stats = retriever.embedder.stats()
+    if retriever.embedding_cache is not None:
+        stats["cache"] = retriever.embedding_cache.stats()
+    return stats
+
+@app.get("/stats/ollama")
+def ollama_stats():
+    return {"backends": ollama_pool.stats(), "hedge_delay_seconds": ollama_pool.hedge_delay()}
+
+@app.get("/stats/logging")
+def logging_stats():
+    return log_writer.stats()
+
+@app.get("/metrics")
+def prometheus_metrics():
+    # point-in-time component stats are sampled at scrape time
+    for state, value in log_writer.stats().items():
+        metrics.log_queue.set(value, state=state)
+    retriever = loaded_retriever()
+    if retriever is not None:
+        for name, value in retriever.embedder.stats()["queue_wait_ms"].items():
+            metrics.embedding_queue_wait.set(value, stat=name)
+    for backend in ollama_pool.stats():
+        metrics.ollama_backend_healthy.set(1 if backend["healthy"] else 0, backend=backend["url"])
+        metrics.ollama_backend_in_flight.set(backend["in_flight"], backend=backend["url"])
+        metrics.ollama_backend_requests.set(backend["requests"], backend=backend["url"], kind="sent")
+        metrics.ollama_backend_requests.set(backend["failures"], backend=backend["url"], kind="failed")
+        metrics.ollama_backend_requests.set(backend["slow"], backend=backend["url"], kind="slow")
+
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+app.include_router(query_router)
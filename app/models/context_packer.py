@@ -0,0 +1,124 @@
+import os
+import re
+from typing import Dict, List, Set, Tuple
+
+from app.retrieval.lexical import tokenize
+
+# Prompt tokens available for retrieved context (markers included); 0 sends
+# every retrieved chunk in full
+CONTEXT_TOKEN_BUDGET = int(os.getenv("VERIFAI_CONTEXT_TOKEN_BUDGET", "1024"))
+
+# tokenizer.json of the generation model for exact counts (needs `tokenizers`).
+# Set it for both chunking and serving so stored and live counts agree.
+PROMPT_TOKENIZER_FILE = os.getenv("VERIFAI_PROMPT_TOKENIZER_FILE", "")
+
+# Without a tokenizer, count word pieces of up to six characters plus each
+# punctuation mark; on the policy corpus this comes to about one token per four
+# characters, the usual rate for Mistral's SentencePiece vocabulary on English
+ESTIMATE_PATTERN = re.compile(r"[^\W_]{1,6}|[^\w\s]|_")
+
+# Sentence ends, and line breaks between bullets
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+
+_tokenizer = None
+
+
+def count_tokens(text: str) -> int:
+    global _tokenizer
+    if PROMPT_TOKENIZER_FILE:
+        if _tokenizer is None:
+            from tokenizers import Tokenizer
+            _tokenizer = Tokenizer.from_file(PROMPT_TOKENIZER_FILE)
+        return len(_tokenizer.encode(text, add_special_tokens=False).ids)
+    return len(ESTIMATE_PATTERN.findall(text))
+
+
+def citation_marker(chunk_id: str) -> str:
+    return f"[ID: {chunk_id}]"
+
+
+def chunk_tokens(text: str, meta: Dict) -> int:
+    # stored at chunking time; counted here only for chunks indexed before that
+    stored = meta.get("token_count")
+    return stored if stored is not None else count_tokens(text)
+
+
+def excerpt(text: str, query_terms: Set[str], limit: int) -> Tuple[str, int]:
+    """
+    The chunk's header line plus the sentences that best match the query,
+    in their original order, within `limit` tokens. Returns ("", 0) when not
+    even the header and one sentence fit.
+    """
+    header, _, body = text.partition("\n")
+    header_tokens = count_tokens(header)
+    sentences = [s.strip() for s in SENTENCE_SPLIT.split(body) if s.strip()]
+
+    def relevance(i):
+        return len(query_terms & set(tokenize(sentences[i])))
+
+    chosen = []
+    used = header_tokens
+    for i in sorted(range(len(sentences)), key=lambda i: (-relevance(i), i)):
+        tokens = count_tokens(sentences[i])
+        if used + tokens <= limit:
+            chosen.append(i)
+            used += tokens
+
+    if not chosen:
+        return "", 0
+    return "\n".join([header] + [sentences[i] for i in sorted(chosen)]), used
+
+
+def pack_context(
+    query: str,
+    retrieved_chunks: List[Tuple[str, float, Dict]],
+    budget: int = CONTEXT_TOKEN_BUDGET
+) -> Tuple[List[Tuple[str, float, Dict]], Dict]:
+    """
+    Fit the retrieved chunks into `budget` prompt tokens. Chunks are taken
+    whole in score order while they fit; the first one that does not is cut
+    down to its best-matching sentences, and so on until the budget is spent.
+    Every chunk that is kept keeps its [ID: ...] marker, so citations still
+    resolve. Returns the packed chunks (in retrieval order) and the packing
+    stats that are logged with the request.
+    """
+    marker_tokens = [
+        count_tokens(citation_marker(meta.get("chunk_id", "Unknown")))
+        for _, _, meta in retrieved_chunks
+    ]
+    full_tokens = [chunk_tokens(text, meta) for text, _, meta in retrieved_chunks]
+    tokens_before = sum(marker_tokens) + sum(full_tokens)
+
+    stats = {
+        "budget": budget,
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_before,
+        "tokens_saved": 0,
+        "chunks_trimmed": 0,
+        "chunks_dropped": 0
+    }
+    if budget <= 0 or tokens_before <= budget:
+        return retrieved_chunks, stats
+
+    query_terms = set(tokenize(query))
+    remaining = budget
+    packed: Dict[int, Tuple[str, float, Dict]] = {}
+
+    for i in sorted(range(len(retrieved_chunks)), key=lambda i: -retrieved_chunks[i][1]):
+        text, score, meta = retrieved_chunks[i]
+        if marker_tokens[i] + full_tokens[i] <= remaining:
+            packed[i] = retrieved_chunks[i]
+            remaining -= marker_tokens[i] + full_tokens[i]
+            continue
+
+        trimmed, used = excerpt(text, query_terms, remaining - marker_tokens[i])
+        if trimmed:
+            packed[i] = (trimmed, score, meta)
+            remaining -= marker_tokens[i] + used
+            stats["chunks_trimmed"] += 1
+        else:
+            stats["chunks_dropped"] += 1
+
+    stats["tokens_after"] = budget - remaining
+    stats["tokens_saved"] = tokens_before - stats["tokens_after"]
+    return [packed[i] for i in sorted(packed)], stats
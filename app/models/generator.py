@@ -1,22 +1,345 @@
+import asyncio
 import os
+import json
 import time
-from typing import List, Tuple, Dict
+from typing import AsyncIterator, List, Optional, Tuple, Dict
 from dotenv import load_dotenv
 import logging
-import requests
+import httpx
+from app.models.context_packer import CONTEXT_TOKEN_BUDGET, citation_marker, count_tokens, pack_context
+from app.models.ollama_pool import BackendPool
+from app.monitoring import metrics
+from app.monitoring.tracing import span
 
 # Setup
 logger = logging.getLogger("uvicorn.error")
 load_dotenv()
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
+# Point at scripts/mock_ollama.py to load-test without a real model
+OLLAMA_URL = os.getenv("VERIFAI_OLLAMA_URL", "http://localhost:11434/api/generate")
+# "chat" sends the instructions as a system message to /api/chat; "generate"
+# sends them as the system field of /api/generate
+OLLAMA_API = os.getenv("VERIFAI_OLLAMA_API", "chat")
+
+# Comma-separated Ollama servers to balance across (least work in flight
+# first), e.g. "http://gpu1:11434,http://gpu2:11434". Defaults to the server
+# in VERIFAI_OLLAMA_URL.
+OLLAMA_BACKENDS = [
+    url.strip()
+    for url in os.getenv("VERIFAI_OLLAMA_BACKENDS", OLLAMA_URL.rsplit("/api/", 1)[0]).split(",")
+    if url.strip()
+]
+# Consecutive failed requests that take a backend out of rotation, and the
+# minimum time out before a passing health probe (GET /api/tags) re-admits it
+OLLAMA_EJECT_FAILURES = int(os.getenv("VERIFAI_OLLAMA_EJECT_FAILURES", "3"))
+# Consecutive requests that ran past the hedge delay and lost to the hedge
+# before a backend that stalls without erroring is taken out of rotation
+OLLAMA_EJECT_SLOW = int(os.getenv("VERIFAI_OLLAMA_EJECT_SLOW", "3"))
+OLLAMA_EJECT_SECONDS = float(os.getenv("VERIFAI_OLLAMA_EJECT_SECONDS", "30"))
+OLLAMA_PROBE_INTERVAL_SECONDS = float(os.getenv("VERIFAI_OLLAMA_PROBE_INTERVAL_SECONDS", "5"))
+# Race a second backend when a non-streaming request runs past the recent p95
+OLLAMA_HEDGE = os.getenv("VERIFAI_OLLAMA_HEDGE", "0") == "1"
 OLLAMA_MODEL = "mistral:7b-instruct"
+OLLAMA_TIMEOUT = 60
+
+# Connection pool shared by every async request to Ollama
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("VERIFAI_OLLAMA_MAX_CONNECTIONS", "32"))
+OLLAMA_KEEPALIVE_SECONDS = float(os.getenv("VERIFAI_OLLAMA_KEEPALIVE_SECONDS", "120"))
+
+# How long Ollama keeps the model resident after a request (Ollama duration
+# syntax). Sent with every request, so each one pushes the unload back.
+OLLAMA_KEEP_ALIVE = os.getenv("VERIFAI_OLLAMA_KEEP_ALIVE", "30m")
+
+# Context windows num_ctx is chosen from. Ollama reloads the model whenever
+# num_ctx changes, so sizes are bucketed rather than fitted to each prompt.
+OLLAMA_NUM_CTX_BUCKETS = sorted(int(n) for n in os.getenv("VERIFAI_OLLAMA_NUM_CTX_BUCKETS", "2048,4096,8192").split(","))
+# Room left in the window for the answer
+OLLAMA_RESPONSE_TOKENS = int(os.getenv("VERIFAI_OLLAMA_RESPONSE_TOKENS", "512"))
+# Tokens the model's chat template wraps around the messages
+TEMPLATE_OVERHEAD_TOKENS = 32
+
+# Sent ahead of every request. It must stay byte-for-byte identical between
+# requests so Ollama can reuse the KV cache for it; anything that varies per
+# request belongs in the user message built by build_prompt.
+SYSTEM_PROMPT = """Instructions:
+- You are an AI assistant.
+- Answer the question using ONLY the provided context.
+- Do NOT use any prior knowledge.
+- If the answer is not in the context, state that you do not have enough information.
+- Answer ONLY what is necessary to directly answer the question.
+- Do not include additional policy information unless it is explicitly required.
+- After any sentence that comes from a specific chunk, include a citation like [ID: chunk_id].
+- If multiple chunks support the same point, cite all relevant IDs, e.g., [ID: chunk1, chunk2].
+- Do NOT fabricate information or make assumptions.
+- If the context does not provide the answer, say exactly: "I do not have enough information in the provided context."
+"""
+SYSTEM_PROMPT_TOKENS = count_tokens(SYSTEM_PROMPT)
+
+# Per-token pricing used to cost each request; 0 for a self-hosted model
+COST_PER_1K_PROMPT_TOKENS = float(os.getenv("VERIFAI_COST_PER_1K_PROMPT_TOKENS", "0"))
+COST_PER_1K_COMPLETION_TOKENS = float(os.getenv("VERIFAI_COST_PER_1K_COMPLETION_TOKENS", "0"))
+
+_async_client: Optional[httpx.AsyncClient] = None
+
+ollama_pool = BackendPool(
+    OLLAMA_BACKENDS,
+    eject_failures=OLLAMA_EJECT_FAILURES,
+    eject_slow=OLLAMA_EJECT_SLOW,
+    eject_seconds=OLLAMA_EJECT_SECONDS,
+    probe_interval=OLLAMA_PROBE_INTERVAL_SECONDS
+)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=OLLAMA_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=OLLAMA_MAX_CONNECTIONS,
+                keepalive_expiry=OLLAMA_KEEPALIVE_SECONDS
+            )
+        )
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def preload_model_async(model_tier: str = OLLAMA_MODEL) -> Dict:
+    """
+    Ask every Ollama backend to load the model without generating anything,
+    so the first real request does not pay the load time. Returns each
+    backend's load timing, or its error.
+    """
+    # an empty request only loads the model; it must use the num_ctx of real
+    # requests, or the first of them reloads it
+    path, payload = ollama_request("", model_tier, stream=False, settings=ollama_settings(""))
+    if OLLAMA_API == "chat":
+        payload["messages"] = []
+
+    async def preload(backend):
+        try:
+            response = await get_async_client().post(backend.url + path, json=payload)
+            response.raise_for_status()
+            return {"url": backend.url, "load_ms": round(response.json().get("load_duration", 0) / 1e6, 3)}
+        except Exception as e:
+            return {"url": backend.url, "error": str(e)}
+
+    results = await asyncio.gather(*(preload(backend) for backend in ollama_pool.backends))
+    if all("error" in result for result in results):
+        raise RuntimeError(results[0]["error"])
+    return {"model": model_tier, "backends": list(results)}
+
+
+async def _post_backend(backend, path: str, payload: Dict) -> Dict:
+    ok = None
+    start = time.perf_counter()
+    try:
+        response = await get_async_client().post(backend.url + path, json=payload)
+        response.raise_for_status()
+        data = response.json()
+        ok = True
+        return data
+    except asyncio.CancelledError:
+        # lost a hedge race: says nothing about the backend's health
+        raise
+    except Exception:
+        ok = False
+        raise
+    finally:
+        ollama_pool.release(backend, ok, time.perf_counter() - start)
+
+
+async def post_ollama(path: str, payload: Dict) -> Tuple[Dict, Dict]:
+    """
+    Send a non-streaming request to the least-loaded backend. A request that
+    fails outright is retried once on another backend; with OLLAMA_HEDGE, one
+    still running after the pool's p95 latency is raced against another
+    backend and the first answer wins. Returns the response and which backend
+    produced it.
+    """
+    tried = [ollama_pool.acquire()]
+    tasks = {asyncio.create_task(_post_backend(tried[0], path, payload)): tried[0]}
+    hedge_delay = ollama_pool.hedge_delay() if OLLAMA_HEDGE else None
+    hedge = None
+    slow = None
+    last_error = None
+
+    try:
+        while tasks:
+            # only the first request is hedged
+            timeout = hedge_delay if len(tried) == 1 else None
+            done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                hedge_delay = None
+                hedge = ollama_pool.acquire(exclude=tried)
+                if hedge is not None:
+                    tried.append(hedge)
+                    tasks[asyncio.create_task(_post_backend(hedge, path, payload))] = hedge
+                    metrics.ollama_hedges_total.inc(result="sent")
+                continue
+
+            for task in done:
+                backend = tasks.pop(task)
+                if task.exception() is None:
+                    if backend is hedge:
+                        metrics.ollama_hedges_total.inc(result="won")
+                        if tried[0] in tasks.values():
+                            slow = tried[0]
+                    return task.result(), {"backend": backend.url, "attempts": len(tried)}
+                last_error = task.exception()
+
+            if not tasks and len(tried) == 1:
+                retry = ollama_pool.acquire(exclude=tried)
+                if retry is not None:
+                    tried.append(retry)
+                    tasks[asyncio.create_task(_post_backend(retry, path, payload))] = retry
+                    metrics.ollama_retries_total.inc()
+
+        raise last_error
+    finally:
+        for task in tasks:
+            task.cancel()
+        if slow is not None:
+            ollama_pool.record_slow(slow)
+
+
+def choose_num_ctx(prompt_tokens: int) -> int:
+    needed = SYSTEM_PROMPT_TOKENS + TEMPLATE_OVERHEAD_TOKENS + prompt_tokens + OLLAMA_RESPONSE_TOKENS
+    for size in OLLAMA_NUM_CTX_BUCKETS:
+        if size >= needed:
+            return size
+    return OLLAMA_NUM_CTX_BUCKETS[-1]
+
+
+def ollama_settings(prompt: str) -> Dict:
+    """
+    Per-request Ollama settings, also logged with the request so prompt-eval
+    and load times can be compared across configurations.
+    """
+    prompt_tokens = count_tokens(prompt)
+    return {
+        "api": OLLAMA_API,
+        "num_ctx": choose_num_ctx(prompt_tokens),
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "prompt_tokens_estimated": SYSTEM_PROMPT_TOKENS + prompt_tokens
+    }
+
+
+def ollama_request(prompt: str, model_tier: str, stream: bool, settings: Dict) -> Tuple[str, Dict]:
+    """
+    API path and body for one request: the fixed SYSTEM_PROMPT first, then
+    the per-request prompt.
+    """
+    payload = {
+        "model": model_tier,
+        "stream": stream,
+        "keep_alive": settings["keep_alive"],
+        "options": {"num_ctx": settings["num_ctx"]}
+    }
+    if OLLAMA_API == "chat":
+        payload["messages"] = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        return "/api/chat", payload
+
+    payload["system"] = SYSTEM_PROMPT
+    payload["prompt"] = prompt
+    return "/api/generate", payload
+
+
+def response_text(data: Dict) -> str:
+    # /api/chat nests the text in a message, /api/generate does not
+    if "message" in data:
+        return data["message"].get("content", "")
+    return data.get("response", "")
+
 
-def generate_answer(
-    query: str, 
-    retrieved_chunks: List[Tuple[str, float, Dict]], 
+def ollama_usage(data: Dict) -> Dict:
+    """
+    Token counts and timings from Ollama's final response, durations in ms.
+    prompt_eval_count is omitted by Ollama when the whole prompt was cached.
+    """
+    def ms(field):
+        return round(data[field] / 1e6, 3) if field in data else None
+
+    def rate(count, duration_ms):
+        return round(count / (duration_ms / 1000), 2) if count and duration_ms else None
+
+    usage = {
+        "prompt_tokens": data.get("prompt_eval_count", 0),
+        "completion_tokens": data.get("eval_count", 0),
+        "load_ms": ms("load_duration"),
+        "prompt_eval_ms": ms("prompt_eval_duration"),
+        "eval_ms": ms("eval_duration"),
+        "total_ms": ms("total_duration")
+    }
+    usage["prompt_tokens_per_second"] = rate(usage["prompt_tokens"], usage["prompt_eval_ms"])
+    usage["tokens_per_second"] = rate(usage["completion_tokens"], usage["eval_ms"])
+    return usage
+
+
+def estimate_cost(usage: Optional[Dict]) -> float:
+    if not usage:
+        return 0.0
+    return round(
+        usage["prompt_tokens"] / 1000 * COST_PER_1K_PROMPT_TOKENS
+        + usage["completion_tokens"] / 1000 * COST_PER_1K_COMPLETION_TOKENS,
+        6
+    )
+
+
+def build_sources(retrieved_chunks: List[Tuple[str, float, Dict]]) -> List[Dict]:
+    sources = []
+    for _, score, meta in retrieved_chunks:
+        source = {"id": meta.get("chunk_id", "Unknown"), "source": meta.get("source"), "score": score}
+        # near-duplicate chunks collapsed into this one at ingestion are sources too
+        if meta.get("duplicate_count"):
+            source["duplicate_ids"] = meta["duplicate_chunk_ids"].split(", ")
+            source["also_in"] = [name for name in meta["sources"].split("; ") if name != meta.get("source")]
+        sources.append(source)
+    return sources
+
+def build_prompt(
+    query: str,
+    retrieved_chunks: List[Tuple[str, float, Dict]],
+    budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[str, List[Dict], Dict]:
+
+    # Fit the chunks into the context token budget; only what is sent is a source
+    packed_chunks, packing = pack_context(query, retrieved_chunks, budget)
+
+    # Prepare Context and Citations
+    context_blocks = []
+    sources = build_sources(packed_chunks)
+
+    for chunk, score, meta in packed_chunks:
+        cid = meta.get("chunk_id", "Unknown")
+        context_blocks.append(f"{citation_marker(cid)}\n{chunk}")
+
+    context_text = "\n\n".join(context_blocks)
+
+    # Only this part varies between requests; the instructions are SYSTEM_PROMPT
+    prompt = f"CONTEXT:\n{context_text}\n\nQUESTION:\n{query}"
+
+    return prompt, sources, packing
+
+async def generate_answer_async(
+    query: str,
+    retrieved_chunks: List[Tuple[str, float, Dict]],
     model_tier: str = OLLAMA_MODEL) -> Dict:
-    
+    """
+    Answer from the retrieved chunks with one non-streaming request, through
+    the backend pool. LLM errors are returned as a result with no answer.
+    """
+
     if not retrieved_chunks:
         return {
             "answer": None,
@@ -25,55 +348,21 @@ def generate_answer(
             "latency": 0,
             "reason": "No retrieved context"
         }
-    
-    start_time = time.time()
-    
-    # Prepare Context and Citations
-    context_blocks = []
-    sources = []
-
-    for chunk, score, meta in retrieved_chunks:
-        cid = meta.get("chunk_id", "Unknown")
-        context_blocks.append(f"[ID: {cid}]\n{chunk}")
-        sources.append({"id": cid, "source": meta.get("source"), "score": score})
 
-    context_text = "\n\n".join(context_blocks)
+    start_time = time.time()
 
-    # Construct Prompt with strict grounding
-    prompt = f"""
-    Instructions:
-    - You are an AI assistant. 
-    - Answer the question using ONLY the provided context.
-    - Do NOT use any prior knowledge.
-    - If the answer is not in the context, state that you do not have enough information.
-    - Answer ONLY what is necessary to directly answer the question.
-    - Do not include additional policy information unless it is explicitly required.
-    - After any sentence that comes from a specific chunk, include a citation like [ID: chunk_id].
-    - If multiple chunks support the same point, cite all relevant IDs, e.g., [ID: chunk1, chunk2].
-    - Do NOT fabricate information or make assumptions.
-    - If the context does not provide the answer, say exactly: "I do not have enough information in the provided context."
-
-    CONTEXT:
-    {context_text}
-
-    QUESTION: 
-    {query}
-    """
+    with span("build_prompt") as attributes:
+        prompt, sources, packing = build_prompt(query, retrieved_chunks)
+        settings = ollama_settings(prompt)
+        attributes["tokens_saved"] = packing["tokens_saved"]
 
     # Call LLM
     try:
-        response = requests.post(
-            OLLAMA_URL,
-            json={
-                "model": model_tier,
-                "prompt": prompt,
-                "stream": False
-            },
-            timeout=60
-        )
-
-        response.raise_for_status()
-        answer_text = response.json()["response"].strip()
+        with span("llm_call", model=model_tier, num_ctx=settings["num_ctx"]):
+            path, payload = ollama_request(prompt, model_tier, stream=False, settings=settings)
+            data, served_by = await post_ollama(path, payload)
+            settings.update(served_by)
+        answer_text = response_text(data).strip()
 
         if not answer_text:
             answer_text = "I do not have enough information in the provided context."
@@ -85,15 +374,85 @@ def generate_answer(
             "sources": sources,
             "model_used": model_tier,
             "latency": round(time.time() - start_time, 3),
-            "reason": f"LLM error: {str(e)}"
+            "reason": f"LLM error: {str(e)}",
+            "context": packing,
+            "ollama": settings
         }
-    
+
     latency = round(time.time() - start_time, 3)
 
-    # Return the structured data
     return {
         "answer": answer_text,
         "sources": sources,
         "model_used": model_tier,
-        "latency": latency
-    }
\ No newline at end of file
+        "latency": latency,
+        "usage": ollama_usage(data),
+        "context": packing,
+        "ollama": settings
+    }
+
+
+async def stream_answer_async(
+    prompt: str,
+    model_tier: str = OLLAMA_MODEL,
+    usage: Optional[Dict] = None,
+    settings: Optional[Dict] = None) -> AsyncIterator[str]:
+    """
+    Yield answer tokens from Ollama as they are generated.
+    Errors are raised to the caller, which decides how to surface them.
+    If given, `usage` is filled from the final chunk once the stream ends.
+    """
+
+    settings = settings if settings is not None else ollama_settings(prompt)
+    path, payload = ollama_request(prompt, model_tier, stream=True, settings=settings)
+    tried = []
+    # only read on the retry; the first acquire always returns a backend
+    last_error = None
+
+    while True:
+        backend = ollama_pool.acquire(exclude=tried)
+        if backend is None:
+            raise last_error
+        tried.append(backend)
+        settings["backend"] = backend.url
+        settings["attempts"] = len(tried)
+
+        yielded = False
+        ok = None
+        try:
+            async with get_async_client().stream("POST", backend.url + path, json=payload) as response:
+                response.raise_for_status()
+
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise RuntimeError(chunk["error"])
+
+                    token = response_text(chunk)
+                    if token:
+                        yielded = True
+                        yield token
+
+                    if chunk.get("done"):
+                        if usage is not None:
+                            usage.update(ollama_usage(chunk))
+                        break
+            ok = True
+            return
+        except (asyncio.CancelledError, GeneratorExit):
+            raise
+        except httpx.TransportError as e:
+            ok = False
+            # nothing reached the client yet (e.g. the server is restarting): try another backend once
+            if yielded or len(tried) > 1:
+                raise
+            last_error = e
+            metrics.ollama_retries_total.inc()
+        except Exception:
+            ok = False
+            raise
+        finally:
+            ollama_pool.release(backend, ok)
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class Backend:
+    """
+    One Ollama server and what the pool knows about it.
+    """
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.in_flight = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.consecutive_slow = 0
+        self.ejected_at = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.slow = 0
+
+
+class BackendPool:
+    """
+    Least-loaded balancing over several Ollama servers. A backend is ejected
+    after `eject_failures` consecutive failed requests, `eject_slow`
+    consecutive requests that ran past the hedge delay and lost to the hedge
+    (a backend that stalls without erroring), or a failed health probe, and
+    re-admitted by the first successful probe at least
+    `eject_seconds` later. If every backend is ejected, requests still go to
+    the least-loaded one rather than failing outright.
+
+    Request latencies feed a rolling window whose p95 is the hedge delay:
+    a request still running after it may be raced against a second backend.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        eject_failures: int = 3,
+        eject_slow: int = 3,
+        eject_seconds: float = 30.0,
+        probe_interval: float = 5.0,
+        probe_timeout: float = 2.0,
+        latency_window: int = 200,
+        hedge_min_samples: int = 20
+    ):
+        self.backends = [Backend(url) for url in urls]
+        self.eject_failures = eject_failures
+        self.eject_slow = eject_slow
+        self.eject_seconds = eject_seconds
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.hedge_min_samples = hedge_min_samples
+
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def acquire(self, exclude: Optional[List[Backend]] = None) -> Optional[Backend]:
+        """
+        Reserve the healthy backend with the least work in flight. With
+        `exclude` (a hedge or retry), only a different healthy backend is
+        returned, or None if there is none.
+        """
+        exclude = exclude or []
+        with self._lock:
+            candidates = [b for b in self.backends if b.healthy and b not in exclude]
+            if not candidates:
+                if exclude:
+                    return None
+                candidates = self.backends
+            # ties go to the backend that has served the fewest requests
+            backend = min(candidates, key=lambda b: (b.in_flight, b.requests))
+            backend.in_flight += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend: Backend, ok: Optional[bool], seconds: Optional[float] = None):
+        """
+        Finish a request. ok=None (cancelled, e.g. it lost a hedge) counts as
+        neither success nor failure.
+        """
+        with self._lock:
+            backend.in_flight -= 1
+            if ok is None:
+                return
+            if ok:
+                backend.consecutive_failures = 0
+                backend.consecutive_slow = 0
+                if seconds is not None:
+                    self._latencies.append(seconds)
+                return
+
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            if backend.healthy and backend.consecutive_failures >= self.eject_failures:
+                self._eject(backend, f"{backend.consecutive_failures} consecutive failures")
+
+    def record_slow(self, backend: Backend):
+        """
+        A request on `backend` ran past the hedge delay and the hedge answered
+        first. Its cancellation is released as neither success nor failure,
+        so without this a backend that always stalls would never be ejected.
+        """
+        with self._lock:
+            backend.slow += 1
+            backend.consecutive_slow += 1
+            if backend.healthy and backend.consecutive_slow >= self.eject_slow:
+                self._eject(backend, f"{backend.consecutive_slow} consecutive requests lost to a hedge")
+
+    def _eject(self, backend: Backend, reason: str):
+        backend.healthy = False
+        backend.ejected_at = time.monotonic()
+        logger.warning(f"Ejecting Ollama backend {backend.url}: {reason}")
+
+    def hedge_delay(self) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            return float(np.percentile(self._latencies, 95))
+
+    async def probe(self, client: httpx.AsyncClient):
+        async def check(backend: Backend):
+            try:
+                response = await client.get(f"{backend.url}/api/tags", timeout=self.probe_timeout)
+                response.raise_for_status()
+                ok = True
+            except Exception as e:
+                ok = False
+                error = e
+
+            with self._lock:
+                if ok and not backend.healthy and time.monotonic() - backend.ejected_at >= self.eject_seconds:
+                    backend.healthy = True
+                    backend.consecutive_failures = 0
+                    backend.consecutive_slow = 0
+                    logger.info(f"Re-admitting Ollama backend {backend.url}")
+                elif not ok and backend.healthy:
+                    self._eject(backend, f"health probe failed: {error}")
+
+        await asyncio.gather(*(check(backend) for backend in self.backends))
+
+    async def _probe_loop(self, get_client: Callable[[], httpx.AsyncClient]):
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            try:
+                await self.probe(get_client())
+            except Exception:
+                logger.exception("Ollama health probe failed")
+
+    def start_probes(self, get_client: Callable[[], httpx.AsyncClient]):
+        if self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe_loop(get_client))
+
+    def stop_probes(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {
+                    "url": b.url,
+                    "healthy": b.healthy,
+                    "in_flight": b.in_flight,
+                    "requests": b.requests,
+                    "failures": b.failures,
+                    "slow": b.slow
+                }
+                for b in self.backends
+            ]
@@ -0,0 +1,76 @@
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.models.generator import OLLAMA_MODEL
+
+# Faster local model for questions retrieval already answers clearly (e.g.
+# "llama3.2:3b" after `ollama pull`); empty sends everything to OLLAMA_MODEL
+SMALL_MODEL = os.getenv("VERIFAI_ROUTER_SMALL_MODEL", "")
+
+# Retrieval counts as strong when the best chunk's cosine similarity to the
+# question is at least this (the same on every retriever backend) and at least
+# this share of the chunks come from its document
+ROUTER_MIN_TOP_SCORE = float(os.getenv("VERIFAI_ROUTER_MIN_TOP_SCORE", "0.65"))
+ROUTER_MIN_SOURCE_SHARE = float(os.getenv("VERIFAI_ROUTER_MIN_SOURCE_SHARE", "0.6"))
+
+TIERS = {"small": SMALL_MODEL, "large": OLLAMA_MODEL}
+
+
+def retrieval_signals(
+    retrieved_chunks: List[Tuple[str, float, Dict]],
+    cosine: Optional[Callable[[float], float]] = None
+) -> Dict:
+    """
+    Top-1 cosine similarity and the share of retrieved chunks that come from
+    the top chunk's document. `cosine` maps the retriever's scores to cosine
+    similarity; without it the scores are taken as cosine already.
+    """
+    def document(meta):
+        return meta.get("doc_id") or meta.get("source")
+
+    _, top_score, top_meta = max(retrieved_chunks, key=lambda chunk: chunk[1])
+    same_document = sum(1 for _, _, meta in retrieved_chunks if document(meta) == document(top_meta))
+    return {
+        "top_score": round(cosine(top_score) if cosine else top_score, 3),
+        "source_share": round(same_document / len(retrieved_chunks), 3)
+    }
+
+
+def route(
+    retrieved_chunks: List[Tuple[str, float, Dict]],
+    remaining_budget_ms: Optional[float] = None,
+    estimated_ms: Optional[Dict[str, float]] = None,
+    cosine: Optional[Callable[[float], float]] = None
+) -> Dict:
+    """
+    Pick the model tier for one request. Strong, single-document retrieval
+    goes to the small model; everything else escalates to the large one,
+    unless the large model's typical generation time would not fit in what
+    is left of the request's latency budget.
+    """
+    signals = retrieval_signals(retrieved_chunks, cosine)
+    estimated_ms = estimated_ms or {}
+
+    def decision(tier: str, reason: str) -> Dict:
+        return {
+            "tier": tier,
+            "model": TIERS[tier],
+            "reason": reason,
+            "signals": signals,
+            "remaining_budget_ms": remaining_budget_ms,
+            "estimated_ms": {name: round(ms) for name, ms in estimated_ms.items()}
+        }
+
+    if not SMALL_MODEL:
+        return decision("large", "single_tier")
+
+    strong_score = signals["top_score"] >= ROUTER_MIN_TOP_SCORE
+    dominant_source = signals["source_share"] >= ROUTER_MIN_SOURCE_SHARE
+    if strong_score and dominant_source:
+        return decision("small", "strong_retrieval")
+
+    # no estimate yet means no evidence the large model is too slow
+    if remaining_budget_ms is not None and estimated_ms.get("large", 0) > remaining_budget_ms:
+        return decision("small", "latency_budget")
+
+    return decision("large", "split_sources" if strong_score else "low_top_score")
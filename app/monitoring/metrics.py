@@ -0,0 +1,343 @@
+import bisect
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; wide enough to cover both cached answers and cold 7B generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+CONFIDENCE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+TOKENS_PER_SECOND_BUCKETS = (1, 2.5, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """
+    A named metric family; each distinct label combination is one series.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}"
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted(self._series.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in series
+        ]
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted(self._series.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in series
+        ]
+
+
+class Histogram(Metric):
+    """
+    Cumulative-bucket histogram, so p95/p99 can be computed server-side with
+    histogram_quantile() across scrapes and workers.
+    """
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._series[key] = (counts, total + value)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+
+        lines = []
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="{}"'.format(_format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+stage_latency = registry.register(Histogram(
+    "verifai_stage_latency_seconds",
+    "Request latency per pipeline stage (retrieval, generation, ttft, total).",
+    labelnames=("endpoint", "stage")
+))
+
+requests_total = registry.register(Counter(
+    "verifai_requests_total",
+    "Answered and refused requests by outcome and refusal reason.",
+    labelnames=("endpoint", "outcome", "reason")
+))
+
+cache_hits_total = registry.register(Counter(
+    "verifai_answer_cache_hits_total",
+    "Requests served from the semantic answer cache.",
+    labelnames=("endpoint",)
+))
+
+llm_errors_total = registry.register(Counter(
+    "verifai_llm_errors_total",
+    "Generation calls that failed and returned no answer.",
+    labelnames=("endpoint",)
+))
+
+tier_requests_total = registry.register(Counter(
+    "verifai_tier_requests_total",
+    "Requests generated by each model tier, by outcome (including LLM_ERROR).",
+    labelnames=("endpoint", "tier", "outcome")
+))
+
+tier_generation_latency = registry.register(Histogram(
+    "verifai_tier_generation_seconds",
+    "Generation latency of each model tier.",
+    labelnames=("endpoint", "tier"),
+    buckets=LATENCY_BUCKETS
+))
+
+tier_confidence = registry.register(Histogram(
+    "verifai_tier_confidence",
+    "Confidence of answered (not refused) requests by model tier.",
+    labelnames=("endpoint", "tier"),
+    buckets=CONFIDENCE_BUCKETS
+))
+
+llm_tokens_total = registry.register(Counter(
+    "verifai_llm_tokens_total",
+    "Tokens processed by Ollama, by kind (prompt, completion).",
+    labelnames=("endpoint", "kind")
+))
+
+context_tokens_saved_total = registry.register(Counter(
+    "verifai_context_tokens_saved_total",
+    "Prompt tokens cut from retrieved context by the token-budget packer.",
+    labelnames=("endpoint",)
+))
+
+llm_tokens_per_second = registry.register(Histogram(
+    "verifai_llm_tokens_per_second",
+    "Ollama completion decode speed per request.",
+    labelnames=("endpoint",),
+    buckets=TOKENS_PER_SECOND_BUCKETS
+))
+
+cost_total = registry.register(Counter(
+    "verifai_cost_total",
+    "Estimated generation cost from the configured per-token rates.",
+    labelnames=("endpoint",)
+))
+
+confidence = registry.register(Histogram(
+    "verifai_confidence",
+    "Confidence of answered (not refused) requests.",
+    labelnames=("endpoint",),
+    buckets=CONFIDENCE_BUCKETS
+))
+
+in_flight = registry.register(Gauge(
+    "verifai_requests_in_flight",
+    "Query requests currently being served, including open streams.",
+    labelnames=("endpoint",)
+))
+
+log_queue = registry.register(Gauge(
+    "verifai_log_queue",
+    "Structured-log writer state (queued, written, dropped, rotations).",
+    labelnames=("state",)
+))
+
+ready = registry.register(Gauge(
+    "verifai_ready",
+    "1 once startup warm-up has finished and /ready reports ready."
+))
+
+cold_start_seconds = registry.register(Gauge(
+    "verifai_cold_start_seconds",
+    "Seconds from app import until warm-up finished."
+))
+
+embedding_queue_wait = registry.register(Gauge(
+    "verifai_embedding_queue_wait_ms",
+    "Embedding batcher queue wait percentiles (p50, p95, p99, max) over its recent window.",
+    labelnames=("stat",)
+))
+
+ollama_backend_healthy = registry.register(Gauge(
+    "verifai_ollama_backend_healthy",
+    "1 while an Ollama backend is in rotation, 0 while it is ejected.",
+    labelnames=("backend",)
+))
+
+ollama_backend_in_flight = registry.register(Gauge(
+    "verifai_ollama_backend_in_flight",
+    "Requests currently running on each Ollama backend.",
+    labelnames=("backend",)
+))
+
+ollama_backend_requests = registry.register(Gauge(
+    "verifai_ollama_backend_requests",
+    "Requests sent to, failed on and lost to a hedge by each Ollama backend since startup, by kind (sent, failed, slow).",
+    labelnames=("backend", "kind")
+))
+
+ollama_hedges_total = registry.register(Counter(
+    "verifai_ollama_hedges_total",
+    "Hedged second requests sent after the first ran past the p95, and how many won.",
+    labelnames=("result",)
+))
+
+ollama_retries_total = registry.register(Counter(
+    "verifai_ollama_retries_total",
+    "Requests retried on another Ollama backend after the first one failed."
+))
+
+
+def record_request(
+    endpoint: str,
+    outcome: str,
+    reason,
+    latency_ms: Dict[str, int],
+    confidence_value,
+    cache_hit: bool,
+    llm_error: bool,
+    usage: Optional[Dict] = None,
+    cost: float = 0.0,
+    context: Optional[Dict] = None,
+    tier: Optional[str] = None
+):
+    """
+    Record one finished request; latency_ms holds the same per-stage
+    millisecond values that are written to the structured log.
+    """
+    for stage, value in latency_ms.items():
+        if value is not None:
+            stage_latency.observe(value / 1000, endpoint=endpoint, stage=stage)
+
+    requests_total.inc(endpoint=endpoint, outcome=outcome, reason=reason or "none")
+    if cache_hit:
+        cache_hits_total.inc(endpoint=endpoint)
+    if llm_error:
+        llm_errors_total.inc(endpoint=endpoint)
+    if confidence_value is not None:
+        confidence.observe(confidence_value, endpoint=endpoint)
+    if usage:
+        llm_tokens_total.inc(usage["prompt_tokens"], endpoint=endpoint, kind="prompt")
+        llm_tokens_total.inc(usage["completion_tokens"], endpoint=endpoint, kind="completion")
+        # Ollama's own timings: model (re)loads and prompt evaluation, which
+        # the prefix cache, keep_alive and num_ctx settings are meant to shrink
+        for stage, field in (("ollama_load", "load_ms"), ("ollama_prompt_eval", "prompt_eval_ms")):
+            if usage.get(field) is not None:
+                stage_latency.observe(usage[field] / 1000, endpoint=endpoint, stage=stage)
+        if usage.get("tokens_per_second"):
+            llm_tokens_per_second.observe(usage["tokens_per_second"], endpoint=endpoint)
+    if tier:
+        tier_requests_total.inc(endpoint=endpoint, tier=tier, outcome="LLM_ERROR" if llm_error else outcome)
+        if latency_ms.get("generation") is not None:
+            tier_generation_latency.observe(latency_ms["generation"] / 1000, endpoint=endpoint, tier=tier)
+        if confidence_value is not None:
+            tier_confidence.observe(confidence_value, endpoint=endpoint, tier=tier)
+    if context and context["tokens_saved"]:
+        context_tokens_saved_total.inc(context["tokens_saved"], endpoint=endpoint)
+    if cost:
+        cost_total.inc(cost, endpoint=endpoint)
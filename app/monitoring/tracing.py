@@ -0,0 +1,78 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("verifai_trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("verifai_span", default=None)
+
+
+class Trace:
+    """
+    Spans recorded for one request. The trace travels in a context variable, so
+    spans opened in asyncio.to_thread workers land in the right request.
+    `start` backdates the trace for work done before it was created.
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        self.start = time.perf_counter() if start is None else start
+        self._lock = threading.Lock()
+        self._spans: List[Dict] = []
+
+    def record(self, name: str, parent: Optional[str], start: float, end: float, attributes: Dict):
+        with self._lock:
+            self._spans.append({
+                "name": name,
+                "parent": parent,
+                "start_ms": round((start - self.start) * 1000, 3),
+                "duration_ms": round((end - start) * 1000, 3),
+                **attributes
+            })
+
+    def spans(self) -> List[Dict]:
+        with self._lock:
+            return sorted(self._spans, key=lambda s: s["start_ms"])
+
+    def server_timing(self) -> str:
+        """
+        Spans as a Server-Timing header value, so clients such as
+        scripts/load_test.py can see the per-stage breakdown.
+        """
+        return ", ".join(f'{s["name"]};dur={s["duration_ms"]}' for s in self.spans())
+
+
+def start_trace(trace: Optional[Trace] = None) -> Trace:
+    """
+    Make `trace` (or a new one) current for this task and the work it spawns.
+    """
+    trace = trace or Trace()
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time the enclosed block as a child of the enclosing span. Yields a dict
+    the block may add attributes to; a no-op outside a trace.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield {}
+        return
+
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        end = time.perf_counter()
+        _current_span.reset(token)
+        trace.record(name, parent, start, end, attributes)
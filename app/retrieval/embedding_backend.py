@@ -0,0 +1,123 @@
+import json
+import os
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# "torch" runs the SentenceTransformer model; "onnx" runs the int8-quantized
+# export written by scripts/export_onnx.py through onnxruntime
+EMBEDDING_BACKEND = os.getenv("VERIFAI_EMBEDDING_BACKEND", "torch")
+
+ONNX_MODEL_DIR = Path(os.getenv("VERIFAI_ONNX_MODEL_DIR", f"models/{EMBEDDING_MODEL}-onnx"))
+ONNX_MODEL_FILE = "model.int8.onnx"
+ONNX_TOKENIZER_FILE = "tokenizer.json"
+ONNX_CONFIG_FILE = "export.json"
+
+# Threads used inside one ONNX operator (0 lets onnxruntime use every core).
+# With several uvicorn workers on one host, set this to cores / workers.
+ONNX_INTRA_OP_THREADS = int(os.getenv("VERIFAI_ONNX_INTRA_OP_THREADS", "0"))
+ONNX_INTER_OP_THREADS = int(os.getenv("VERIFAI_ONNX_INTER_OP_THREADS", "1"))
+
+
+def embedder_name(backend: str = EMBEDDING_BACKEND) -> str:
+    """
+    Identifies the vectors a backend produces, for embedding-cache keys and
+    index manifests. The torch name stays the plain model name so vectors
+    cached before backends were pluggable remain valid.
+    """
+    if backend == "torch":
+        return EMBEDDING_MODEL
+    if backend == "onnx":
+        return f"{EMBEDDING_MODEL}@onnx-int8"
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+class TorchEmbedder:
+    """
+    The SentenceTransformer model, as used before backends were pluggable.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        # imported here so the ONNX backend never loads torch
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.name = embedder_name("torch")
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, **kwargs)
+
+
+class OnnxEmbedder:
+    """
+    Mean-pooled, L2-normalised sentence embeddings from an ONNX transformer,
+    reproducing the SentenceTransformer pipeline (Transformer -> Pooling ->
+    Normalize) without torch.
+    """
+
+    def __init__(
+        self,
+        model_dir: Path = ONNX_MODEL_DIR,
+        intra_op_threads: int = ONNX_INTRA_OP_THREADS,
+        inter_op_threads: int = ONNX_INTER_OP_THREADS
+    ):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        with open(model_dir / ONNX_CONFIG_FILE, "r", encoding="utf-8") as f:
+            config = json.load(f)
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / ONNX_TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=config.get("pad_token_id", 0))
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            str(model_dir / ONNX_MODEL_FILE),
+            options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.name = embedder_name("onnx")
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        # SentenceTransformer-only options such as show_progress_bar are ignored
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+
+        batches = [self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        embeddings = np.concatenate(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+def load_embedder(backend: str = EMBEDDING_BACKEND):
+    if backend == "torch":
+        return TorchEmbedder()
+    if backend == "onnx":
+        return OnnxEmbedder()
+    raise ValueError(f"Unknown embedding backend: {backend}")
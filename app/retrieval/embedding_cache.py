@@ -0,0 +1,161 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import numpy as np
+
+EMBEDDING_CACHE_DIR = Path(os.getenv("VERIFAI_EMBEDDING_CACHE_DIR", "cache/embeddings"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("VERIFAI_EMBEDDING_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Size is re-measured on disk after this many writes, since other workers write too
+EVICTION_CHECK_INTERVAL = 256
+# Eviction trims down to this fraction of the limit so it does not run on every write
+EVICTION_LOW_WATERMARK = 0.9
+# A hit refreshes the file mtime (the LRU clock) only once it is this old, so
+# most reads stay reads instead of metadata writes
+MTIME_REFRESH_SECONDS = 3600
+
+VALUE_SUFFIX = ".f32"
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    On-disk, content-addressed embedding cache shared by ingestion and serving.
+
+    Entries are keyed by (model name, sha256 of the normalised text) and stored
+    one per file as raw little-endian float32, so a value can be read with
+    np.fromfile or np.memmap without parsing. Files are written to a temporary
+    name and renamed into place, which keeps concurrent readers in other uvicorn
+    workers from ever seeing a partial vector. Hits refresh a stale file mtime
+    and eviction removes the least recently used files (to within
+    MTIME_REFRESH_SECONDS) once the directory exceeds max_bytes.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        cache_dir: Path = EMBEDDING_CACHE_DIR,
+        max_bytes: int = EMBEDDING_CACHE_MAX_BYTES
+    ):
+        self.model_name = model_name
+        self.root = Path(cache_dir) / re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._writes_since_check = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def _path(self, text: str) -> Path:
+        key = hashlib.sha256(
+            f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")
+        ).hexdigest()
+        return self.root / key[:2] / f"{key[2:]}{VALUE_SUFFIX}"
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        path = self._path(text)
+        try:
+            vector = np.fromfile(path, dtype="<f4")
+            if time.time() - path.stat().st_mtime > MTIME_REFRESH_SECONDS:
+                os.utime(path)
+        except (FileNotFoundError, OSError):
+            # missing, or evicted by another worker between read and touch
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return vector
+
+    def put(self, text: str, vector) -> None:
+        path = self._path(text)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{uuid.uuid4().hex}")
+        np.asarray(vector, dtype="<f4").tofile(tmp_path)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.writes += 1
+            self._writes_since_check += 1
+            check = self._writes_since_check >= EVICTION_CHECK_INTERVAL
+            if check:
+                self._writes_since_check = 0
+
+        if check:
+            self.evict()
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Return embeddings for `texts`, calling encode_fn once with only the misses.
+        """
+        vectors = [self.get(text) for text in texts]
+        missing = [idx for idx, vector in enumerate(vectors) if vector is None]
+
+        if missing:
+            encoded = encode_fn([texts[idx] for idx in missing])
+            for idx, vector in zip(missing, encoded):
+                vector = np.asarray(vector, dtype=np.float32)
+                self.put(texts[idx], vector)
+                vectors[idx] = vector
+
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(vectors)
+
+    def evict(self) -> int:
+        entries = []
+        total = 0
+        for path in self.root.glob(f"*/*{VALUE_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        target = self.max_bytes * EVICTION_LOW_WATERMARK
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions
+            }
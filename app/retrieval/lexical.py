@@ -0,0 +1,167 @@
+import logging
+import os
+import re
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.retrieval.matrix_index import MATRIX_DIR
+
+LEXICAL_INDEX_FILE = MATRIX_DIR / "bm25.npz"
+
+logger = logging.getLogger("uvicorn.error")
+
+# Standard BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Keeps section numbers such as "4.2" as one token
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "for", "from",
+    "how", "i", "if", "in", "is", "it", "my", "of", "on", "or", "that", "the",
+    "this", "to", "what", "when", "which", "who", "will", "with", "you", "your"
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Builder:
+    """
+    Accumulates postings chunk by chunk so the ingestion pipeline can build the
+    index while streaming, then writes it as flat CSR arrays.
+    """
+
+    def __init__(self):
+        self.vocab: Dict[str, int] = {}
+        self.chunk_ids: List[str] = []
+        self.doc_lengths = array("i")
+        self._term_ids = array("i")
+        self._doc_idx = array("i")
+        self._tfs = array("i")
+
+    def add(self, chunk_id: str, text: str):
+        doc_idx = len(self.chunk_ids)
+        self.chunk_ids.append(chunk_id)
+
+        tokens = tokenize(text)
+        self.doc_lengths.append(len(tokens))
+
+        counts: Dict[int, int] = {}
+        for token in tokens:
+            term_id = self.vocab.setdefault(token, len(self.vocab))
+            counts[term_id] = counts.get(term_id, 0) + 1
+
+        for term_id, tf in counts.items():
+            self._term_ids.append(term_id)
+            self._doc_idx.append(doc_idx)
+            self._tfs.append(tf)
+
+    def save(self, path: Path = LEXICAL_INDEX_FILE, k1: float = BM25_K1, b: float = BM25_B):
+        """
+        Postings are grouped by term; each posting stores its full BM25
+        contribution (idf * saturated tf) so querying is a gather and a sum.
+        """
+        num_docs = len(self.chunk_ids)
+        term_ids = np.frombuffer(self._term_ids, dtype=np.int32)
+        doc_idx = np.frombuffer(self._doc_idx, dtype=np.int32)
+        tfs = np.frombuffer(self._tfs, dtype=np.int32).astype(np.float32)
+        doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.int32).astype(np.float32)
+
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, doc_idx, tfs = term_ids[order], doc_idx[order], tfs[order]
+
+        df = np.bincount(term_ids, minlength=len(self.vocab)).astype(np.float32)
+        offsets = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+
+        idf = np.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+        avg_length = doc_lengths.mean() if num_docs else 1.0
+        norm = k1 * (1 - b + b * doc_lengths[doc_idx] / max(avg_length, 1e-9))
+        weights = (idf[term_ids] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+
+        terms = sorted(self.vocab, key=self.vocab.get)
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                terms=np.array(terms, dtype=str),
+                chunk_ids=np.array(self.chunk_ids, dtype=str),
+                offsets=offsets,
+                doc_idx=doc_idx,
+                weights=weights
+            )
+        os.replace(tmp_path, path)
+
+
+class _LoadedPostings:
+    """
+    One saved index, swapped in as a unit so a search never mixes two builds.
+    """
+
+    def __init__(self, path: Path):
+        self.version = path.stat().st_mtime
+        with np.load(path) as data:
+            self.vocab = {term: idx for idx, term in enumerate(data["terms"].tolist())}
+            self.chunk_ids = data["chunk_ids"].tolist()
+            self.offsets = data["offsets"]
+            self.doc_idx = data["doc_idx"]
+            self.weights = data["weights"]
+
+
+class BM25Index:
+    """
+    Query side of the index written by BM25Builder. A rebuild (a new file
+    mtime) is picked up by the next search without restarting, like
+    MatrixIndex re-exports, so hybrid fusion never ranks against a stale corpus.
+    """
+
+    def __init__(self, path: Path = LEXICAL_INDEX_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._loaded = _LoadedPostings(self.path)
+
+    def _current(self) -> _LoadedPostings:
+        try:
+            changed = self.path.stat().st_mtime != self._loaded.version
+        except OSError:
+            changed = False
+        if changed:
+            with self._lock:
+                try:
+                    if self.path.stat().st_mtime != self._loaded.version:
+                        self._loaded = _LoadedPostings(self.path)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"BM25 index reload deferred: {e}")
+        return self._loaded
+
+    def version(self) -> float:
+        return self._current().version
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        loaded = self._current()
+        term_ids = [loaded.vocab[t] for t in set(tokenize(query)) if t in loaded.vocab]
+        if not term_ids or not loaded.chunk_ids:
+            return []
+
+        spans = [slice(loaded.offsets[t], loaded.offsets[t + 1]) for t in term_ids]
+        scores = np.bincount(
+            np.concatenate([loaded.doc_idx[s] for s in spans]),
+            weights=np.concatenate([loaded.weights[s] for s in spans]),
+            minlength=len(loaded.chunk_ids)
+        )
+
+        k = min(top_k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(loaded.chunk_ids[i], float(scores[i])) for i in top]
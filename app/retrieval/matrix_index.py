@@ -0,0 +1,241 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+MATRIX_DIR = Path("data/index")
+EMBEDDINGS_FILE = "embeddings.npy"
+STORE_FILE = "store.json"
+MANIFEST_FILE = "manifest.json"
+
+# Row-aligned chunk store as flat UTF-8 blobs plus offset arrays. Both are
+# memory-mapped, so every worker process shares one page-cache copy instead of
+# holding its own parsed JSON; only the top-k rows are ever decoded.
+STORE_FORMAT = "mapped"
+
+# float16 halves the matrix size; cosine scores stay accurate to ~1e-3
+SUPPORTED_DTYPES = ("float32", "float16")
+
+# Rows of a float16 matrix upcast per matmul (about 25 MB at 384 dimensions)
+MATMUL_BLOCK_ROWS = 16384
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _write_atomic(path: Path, write: Callable):
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _write_strings(index_dir: Path, column: str, values: List[str]):
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+
+    _write_atomic(index_dir / f"{column}.bin", lambda f: f.write(b"".join(encoded)))
+    _write_atomic(index_dir / f"{column}.offsets.npy", lambda f: np.save(f, offsets))
+
+
+class MappedStrings:
+    """
+    Read-only sequence over a column written by _write_strings.
+    """
+
+    def __init__(self, index_dir: Path, column: str, decode: Optional[Callable] = None):
+        self.offsets = np.load(index_dir / f"{column}.offsets.npy", mmap_mode="r")
+        path = index_dir / f"{column}.bin"
+        # np.memmap cannot map an empty file
+        self.data = np.memmap(path, dtype=np.uint8, mode="r") if path.stat().st_size else b""
+        self.decode = decode
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int):
+        value = bytes(self.data[self.offsets[row]:self.offsets[row + 1]]).decode("utf-8")
+        return self.decode(value) if self.decode else value
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+
+def export_matrix(
+    ids: List[str],
+    documents: List[str],
+    embeddings,
+    metadatas: List[Dict],
+    model_name: str,
+    index_dir: Path = MATRIX_DIR,
+    dtype: str = "float32"
+):
+    """
+    Write the pre-normalised embedding matrix plus the row-aligned chunk store.
+    Files are replaced atomically so running servers keep their current mapping
+    until they reopen; the manifest is written last and marks a complete export.
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported dtype {dtype}, expected one of {SUPPORTED_DTYPES}")
+
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+
+    matrix = _normalize_rows(np.asarray(embeddings, dtype=np.float32)).astype(dtype)
+
+    tmp_embeddings = index_dir / f"{EMBEDDINGS_FILE}.tmp"
+    with open(tmp_embeddings, "wb") as f:
+        np.save(f, matrix)
+    os.replace(tmp_embeddings, index_dir / EMBEDDINGS_FILE)
+
+    _write_strings(index_dir, "ids", ids)
+    _write_strings(index_dir, "documents", documents)
+    _write_strings(index_dir, "metadatas", [json.dumps(meta, ensure_ascii=False) for meta in metadatas])
+
+    tmp_manifest = index_dir / f"{MANIFEST_FILE}.tmp"
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump({
+            "model": model_name,
+            "dtype": dtype,
+            "count": int(matrix.shape[0]),
+            "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+            "store": STORE_FORMAT
+        }, f, indent=2)
+    os.replace(tmp_manifest, index_dir / MANIFEST_FILE)
+
+    # the JSON store written by earlier exports is superseded by the mapped columns
+    (index_dir / STORE_FILE).unlink(missing_ok=True)
+
+
+class _LoadedIndex:
+    """
+    One complete export, opened as a unit so a reload never mixes files from
+    two exports.
+    """
+
+    def __init__(self, index_dir: Path):
+        manifest_path = index_dir / MANIFEST_FILE
+        self.version = manifest_path.stat().st_mtime
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+        self.matrix = np.load(index_dir / EMBEDDINGS_FILE, mmap_mode="r")
+
+        if self.manifest.get("store") == STORE_FORMAT:
+            self.ids = list(MappedStrings(index_dir, "ids"))
+            self.documents = MappedStrings(index_dir, "documents")
+            self.metadatas = MappedStrings(index_dir, "metadatas", decode=json.loads)
+        else:
+            # exports from before the mapped store
+            with open(index_dir / STORE_FILE, "r", encoding="utf-8") as f:
+                store = json.load(f)
+            self.ids = store["ids"]
+            self.documents = store["documents"]
+            self.metadatas = store["metadatas"]
+        self.row_by_id = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+
+        # a newer export may have replaced some files after this manifest was read
+        if not (self.manifest.get("count", len(self.ids)) == len(self.ids) == self.matrix.shape[0]):
+            raise ValueError(f"Index files in {index_dir} are from different exports")
+
+
+class MatrixIndex:
+    """
+    Exact top-k search over a memory-mapped, row-normalised embedding matrix.
+
+    Scores are true cosine similarities, unlike the 1/(1+L2) transform applied
+    to Chroma distances. A re-export (a new manifest) is picked up by the next
+    search without restarting.
+    """
+
+    def __init__(self, index_dir: Path = MATRIX_DIR):
+        self.index_dir = Path(index_dir)
+        self._lock = threading.Lock()
+        self._loaded = _LoadedIndex(self.index_dir)
+
+    def _current(self) -> _LoadedIndex:
+        try:
+            changed = (self.index_dir / MANIFEST_FILE).stat().st_mtime != self._loaded.version
+        except OSError:
+            changed = False
+        if changed:
+            with self._lock:
+                try:
+                    if (self.index_dir / MANIFEST_FILE).stat().st_mtime != self._loaded.version:
+                        self._loaded = _LoadedIndex(self.index_dir)
+                except (OSError, ValueError) as e:
+                    # mid-export; keep serving the previous one and retry on the next call
+                    logger.warning(f"Matrix index reload deferred: {e}")
+        return self._loaded
+
+    def _scores(self, loaded: _LoadedIndex, queries: np.ndarray) -> np.ndarray:
+        matrix = loaded.matrix
+        if matrix.dtype == np.float32:
+            return queries @ matrix.T
+
+        # upcast a block of rows at a time instead of copying the whole
+        # (page-cache shared) matrix on every query
+        scores = np.empty((queries.shape[0], matrix.shape[0]), dtype=np.float32)
+        for start in range(0, matrix.shape[0], MATMUL_BLOCK_ROWS):
+            block = matrix[start:start + MATMUL_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores
+
+    def search_batch(self, query_embeddings, top_k: int = 3) -> List[List[Tuple[str, float, Dict]]]:
+        loaded = self._current()
+        if len(query_embeddings) == 0 or len(loaded.ids) == 0:
+            return [[] for _ in query_embeddings]
+
+        queries = _normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+        scores = self._scores(loaded, queries)
+
+        k = min(top_k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+
+        batch_results = []
+        for row, indices in enumerate(top):
+            batch_results.append([
+                (loaded.documents[i], float(scores[row, i]), loaded.metadatas[i])
+                for i in indices
+            ])
+        return batch_results
+
+    def fetch(self, ids: List[str], query_embedding) -> List[Tuple[str, float, Dict]]:
+        """
+        Look up specific chunks, scored against the query like search results.
+        """
+        loaded = self._current()
+        rows = [loaded.row_by_id[chunk_id] for chunk_id in ids if chunk_id in loaded.row_by_id]
+        if not rows:
+            return []
+
+        query = _normalize_rows(np.asarray([query_embedding], dtype=np.float32))[0]
+        scores = np.asarray(loaded.matrix[rows], dtype=np.float32) @ query
+        return [
+            (loaded.documents[row], float(score), loaded.metadatas[row])
+            for row, score in zip(rows, scores)
+        ]
+
+    @staticmethod
+    def cosine(score: float) -> float:
+        return score
+
+    def embedder(self) -> Optional[str]:
+        return self._loaded.manifest.get("model")
+
+    def version(self) -> float:
+        # the export being served, so the answer cache is cleared exactly when results can change
+        return self._current().version
@@ -1,22 +1,397 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+from app.retrieval.embedding_backend import EMBEDDING_BACKEND, load_embedder
+from app.retrieval.embedding_cache import EmbeddingCache
+from app.retrieval.lexical import LEXICAL_INDEX_FILE, BM25Index
+from app.retrieval.matrix_index import MATRIX_DIR, MatrixIndex
+from app.monitoring.tracing import span
 
-class Retriever:
+logger = logging.getLogger("uvicorn.error")
+
+# "chroma" queries the Chroma collection; "matrix" searches the memory-mapped
+# embedding matrix exported by scripts/build_vector_index.py
+RETRIEVER_BACKEND = os.getenv("VERIFAI_RETRIEVER_BACKEND", "chroma")
+
+# "vector" ranks by embedding similarity only; "hybrid" fuses it with BM25
+# using weighted reciprocal rank fusion
+RETRIEVAL_MODE = os.getenv("VERIFAI_RETRIEVAL_MODE", "vector")
+HYBRID_VECTOR_WEIGHT = float(os.getenv("VERIFAI_HYBRID_VECTOR_WEIGHT", "1.0"))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("VERIFAI_HYBRID_LEXICAL_WEIGHT", "1.0"))
+# Candidates drawn from each ranking before fusion
+HYBRID_CANDIDATES = int(os.getenv("VERIFAI_HYBRID_CANDIDATES", "20"))
+RRF_K = 60
+
+EMBEDDING_CACHE_ENABLED = os.getenv("VERIFAI_EMBEDDING_CACHE", "1") == "1"
+
+# Queries arriving within this window (or until the batch is full) share one encode call
+EMBED_BATCH_WINDOW_MS = float(os.getenv("VERIFAI_EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("VERIFAI_EMBED_MAX_BATCH_SIZE", "32"))
+
+# Number of recent queue waits kept for percentile reporting
+EMBED_WAIT_SAMPLES = 1000
+
+
+class BatchingEmbedder:
+    """
+    Coalesces concurrent single-query encodes into batched model.encode calls.
+
+    Callers get a concurrent.futures.Future, so both worker threads (.result())
+    and the event loop (asyncio.wrap_future) can wait on it. A single background
+    thread owns the model, which also keeps CPU-bound encoding and embedding-cache
+    disk reads off the request path. Already-batched encodes are queued too, so
+    the model never runs two encodes at once.
+    """
+
+    def __init__(
+        self,
+        model,
+        window_ms: float = EMBED_BATCH_WINDOW_MS,
+        max_batch_size: int = EMBED_MAX_BATCH_SIZE,
+        cache: Optional[EmbeddingCache] = None
+    ):
+        self.model = model
+        self.cache = cache
+        self.window = window_ms / 1000
+        self.max_batch_size = max(1, max_batch_size)
+
+        self._start()
+        # threads do not survive fork (gunicorn --preload), so each worker starts its own
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._waits_ms = deque(maxlen=EMBED_WAIT_SAMPLES)
+        self._encoded = 0
+
+        self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def submit_batch(self, texts: List[str]) -> Future:
+        """
+        Queue a list of texts as one item; the Future resolves to one vector per text.
+        """
+        future = Future()
+        self._queue.put((list(texts), future, time.monotonic()))
+        return future
+
+    def embed(self, text: str):
+        return self.submit(text).result()
+
+    @staticmethod
+    def _texts(item) -> List[str]:
+        text = item[0]
+        return text if isinstance(text, list) else [text]
+
+    def _collect(self, first):
+        batch = [first]
+        size = len(self._texts(first))
+        deadline = time.monotonic() + self.window
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # re-queue the shutdown marker so the run loop sees it after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+            size += len(self._texts(item))
+
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            self._encode(self._collect(first))
+
+    def _encode(self, batch):
+        started = time.monotonic()
+        # callers that gave up (e.g. a cancelled request) are dropped from the batch
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        texts = [text for item in batch for text in self._texts(item)]
+        with self._stats_lock:
+            self._batch_sizes[len(texts)] += 1
+            self._encoded += len(texts)
+            self._waits_ms.extend((started - enqueued) * 1000 for _, _, enqueued in batch)
+
+        try:
+            if self.cache is not None:
+                vectors = self.cache.encode(texts, self._encode_texts)
+            else:
+                vectors = self._encode_texts(texts)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        position = 0
+        for text, future, _ in batch:
+            if isinstance(text, list):
+                future.set_result(vectors[position:position + len(text)].tolist())
+                position += len(text)
+            else:
+                future.set_result(vectors[position].tolist())
+                position += 1
+
+    def _encode_texts(self, texts):
+        return self.model.encode(texts, batch_size=self.max_batch_size)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            waits = sorted(self._waits_ms)
+            batches = sum(self._batch_sizes.values())
+
+            def percentile(p):
+                return round(waits[min(len(waits) - 1, int(p * len(waits)))], 3) if waits else 0.0
+
+            return {
+                "window_ms": self.window * 1000,
+                "max_batch_size": self.max_batch_size,
+                "queued": self._queue.qsize(),
+                "batches": batches,
+                "queries": self._encoded,
+                "avg_batch_size": round(self._encoded / batches, 3) if batches else 0.0,
+                "batch_size_distribution": dict(sorted(self._batch_sizes.items())),
+                "queue_wait_ms": {
+                    "p50": percentile(0.50),
+                    "p95": percentile(0.95),
+                    "p99": percentile(0.99),
+                    "max": round(waits[-1], 3) if waits else 0.0
+                }
+            }
+
+    def close(self):
+        self._queue.put(None)
+
+
+class ChromaIndex:
     def __init__(self, chroma_dir="chroma_db", collection_name="intern_policies"):
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
+        import chromadb
+
+        self.chroma_dir = Path(chroma_dir)
         self.client = chromadb.PersistentClient(path=str(chroma_dir))
         self.collection = self.client.get_collection(name=collection_name)
 
-    def retrieve(self, query: str, top_k: int = 3):
-        query_embedding = self.model.encode(query).tolist()
+    def search_batch(self, query_embeddings, top_k: int = 3):
+        if not query_embeddings:
+            return []
+
         results = self.collection.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=query_embeddings,
             n_results=top_k,
             include=["documents", "distances", "metadatas"]
         )
 
-        formatted_results = []
-        for doc, dist, meta in zip(results["documents"][0], results["distances"][0], results["metadatas"][0]):
-            similarity = 1 / (1 + dist)
-            formatted_results.append((doc, similarity, meta))
-        return formatted_results
\ No newline at end of file
+        batch_results = []
+        for docs, dists, metas in zip(results["documents"], results["distances"], results["metadatas"]):
+            formatted_results = []
+            for doc, dist, meta in zip(docs, dists, metas):
+                similarity = 1 / (1 + dist)
+                formatted_results.append((doc, similarity, meta))
+            batch_results.append(formatted_results)
+        return batch_results
+
+    def fetch(self, ids, query_embedding):
+        """
+        Look up specific chunks, scored against the query like search results.
+        """
+        if not ids:
+            return []
+
+        results = self.collection.get(ids=ids, include=["documents", "embeddings", "metadatas"])
+        query = np.asarray(query_embedding, dtype=np.float32)
+
+        fetched = []
+        for doc, embedding, meta in zip(results["documents"], results["embeddings"], results["metadatas"]):
+            # Chroma's l2 space reports squared euclidean distance
+            dist = float(np.sum((np.asarray(embedding, dtype=np.float32) - query) ** 2))
+            fetched.append((doc, 1 / (1 + dist), meta))
+        return fetched
+
+    @staticmethod
+    def cosine(score: float) -> float:
+        # score is 1/(1+d) with d the squared L2 distance, and for normalised
+        # embeddings d = 2 - 2*cosine
+        return 1 - (1 / score - 1) / 2
+
+    def embedder(self) -> Optional[str]:
+        # recorded by scripts/build_vector_index.py and scripts/ingest.py after each sync
+        return (self.collection.metadata or {}).get("embedder")
+
+    def version(self) -> float:
+        # The SQLite store is rewritten whenever build_vector_index.py rebuilds the collection
+        return (self.chroma_dir / "chroma.sqlite3").stat().st_mtime
+
+
+class Retriever:
+    def __init__(
+        self,
+        chroma_dir="chroma_db",
+        collection_name="intern_policies",
+        backend: str = RETRIEVER_BACKEND,
+        index_dir=MATRIX_DIR,
+        mode: str = RETRIEVAL_MODE,
+        embedding_backend: str = EMBEDDING_BACKEND
+    ):
+        # torch (or onnxruntime) is only imported here, not when the module loads
+        self.model = load_embedder(embedding_backend)
+        self.embedding_backend = embedding_backend
+
+        if backend == "chroma":
+            self.index = ChromaIndex(chroma_dir, collection_name)
+        elif backend == "matrix":
+            self.index = MatrixIndex(index_dir)
+        else:
+            raise ValueError(f"Unknown retriever backend: {backend}")
+        self.backend = backend
+        self._check_embedder()
+
+        if mode == "hybrid":
+            self.lexical_index = BM25Index(LEXICAL_INDEX_FILE)
+        elif mode != "vector":
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        self.mode = mode
+        self.vector_weight = HYBRID_VECTOR_WEIGHT
+        self.lexical_weight = HYBRID_LEXICAL_WEIGHT
+
+        self.embedding_cache = EmbeddingCache(self.model.name) if EMBEDDING_CACHE_ENABLED else None
+        self.embedder = BatchingEmbedder(self.model, cache=self.embedding_cache)
+
+    def _check_embedder(self):
+        # scores between vectors of different embedders are meaningless
+        index_embedder = self.index.embedder()
+        if index_embedder is None:
+            logger.warning(
+                f"The {self.backend} index does not record its embedder; rebuild it to check that it "
+                f"matches the query embedder {self.model.name}"
+            )
+        elif index_embedder != self.model.name:
+            raise ValueError(
+                f"The {self.backend} index was embedded with {index_embedder} but queries would be embedded "
+                f"with {self.model.name}; rebuild the index with the same VERIFAI_EMBEDDING_BACKEND"
+            )
+
+    def embed(self, query: str):
+        return self.embedder.embed(query)
+
+    def embed_batch(self, queries):
+        # on the batcher's thread, so it never encodes alongside coalesced single queries
+        if not queries:
+            return []
+        return self.embedder.submit_batch(queries).result()
+
+    def search_batch(self, query_embeddings, top_k: int = 3, queries=None):
+        # Hybrid fusion needs the query text; without it fall back to vector ranking
+        if self.mode != "hybrid" or queries is None:
+            with span("vector_search", backend=self.backend):
+                return self.index.search_batch(query_embeddings, top_k)
+
+        with span("vector_search", backend=self.backend):
+            vector_results = self.index.search_batch(query_embeddings, max(top_k, HYBRID_CANDIDATES))
+        with span("hybrid_fusion"):
+            return [
+                self._fuse(query, query_embedding, candidates, top_k)
+                for query, query_embedding, candidates in zip(queries, query_embeddings, vector_results)
+            ]
+
+    def _fuse(self, query: str, query_embedding, vector_results, top_k: int):
+        """
+        Weighted reciprocal rank fusion of the vector and BM25 rankings. The
+        returned score stays the backend's vector score (which cosine() maps
+        to cosine for the guardrails), not an RRF value; fusion only decides
+        which chunks make the cut.
+        """
+        fused = {}
+        by_id = {}
+        for rank, (doc, similarity, meta) in enumerate(vector_results):
+            chunk_id = meta.get("chunk_id")
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + self.vector_weight / (RRF_K + rank + 1)
+            by_id[chunk_id] = (doc, similarity, meta)
+
+        for rank, (chunk_id, _) in enumerate(self.lexical_index.search(query, HYBRID_CANDIDATES)):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + self.lexical_weight / (RRF_K + rank + 1)
+
+        ranked = sorted(fused, key=fused.get, reverse=True)
+
+        # lexical-only candidates past the cut are fetched too, so one that the
+        # vector index no longer holds (mid-rebuild) gives its place to the next
+        missing = [chunk_id for chunk_id in ranked if chunk_id not in by_id]
+        for doc, similarity, meta in self.index.fetch(missing, query_embedding):
+            by_id[meta.get("chunk_id")] = (doc, similarity, meta)
+
+        return [by_id[chunk_id] for chunk_id in ranked if chunk_id in by_id][:top_k]
+
+    def search(self, query_embedding, top_k: int = 3, query=None):
+        return self.search_batch([query_embedding], top_k, None if query is None else [query])[0]
+
+    def retrieve(self, query: str, top_k: int = 3):
+        return self.search(self.embed(query), top_k, query=query)
+
+    def retrieve_batch(self, queries, top_k: int = 3):
+        return self.search_batch(self.embed_batch(queries), top_k, queries=queries)
+
+    def retrieval_info(self) -> dict:
+        if self.mode != "hybrid":
+            return {"mode": self.mode, "embedder": self.model.name}
+        return {
+            "mode": self.mode,
+            "embedder": self.model.name,
+            "fusion": {
+                "method": "rrf",
+                "vector_weight": self.vector_weight,
+                "lexical_weight": self.lexical_weight
+            }
+        }
+
+    async def embed_async(self, query: str):
+        return await asyncio.wrap_future(self.embedder.submit(query))
+
+    async def search_async(self, query_embedding, top_k: int = 3, query=None):
+        return await asyncio.to_thread(self.search, query_embedding, top_k, query)
+
+    async def embed_batch_async(self, queries):
+        if not queries:
+            return []
+        return await asyncio.wrap_future(self.embedder.submit_batch(queries))
+
+    async def search_batch_async(self, query_embeddings, top_k: int = 3, queries=None):
+        return await asyncio.to_thread(self.search_batch, query_embeddings, top_k, queries)
+
+    def index_version(self) -> float:
+        # hybrid rankings also change when the BM25 index is rebuilt
+        if self.mode == "hybrid":
+            return max(self.index.version(), self.lexical_index.version())
+        return self.index.version()
+
+    def cosine(self, score: float) -> float:
+        """
+        Cosine similarity behind a retrieval score, whichever backend produced it.
+        """
+        return self.index.cosine(score)
+
+    def close(self):
+        self.embedder.close()
@@ -1,9 +1,11 @@
-import json
 import pandas as pd
 import streamlit as st
-from pathlib import Path
+from log_indexer import LOG_FILE, LogIndexer, rotated_segments
 
-LOG_FILE = Path("logs/requests.jsonl")
+# Rows per page in the raw log view
+PAGE_SIZE = 100
+# Minute-level charts cover this many most recent hours
+RECENT_HOURS = 24
 
 st.set_page_config(
     page_title="VerifAI Dashboard",
@@ -13,68 +15,82 @@ st.set_page_config(
 st.title("VerifAI — RAG Monitoring Dashboard")
 
 # Load logs
-if not LOG_FILE.exists():
+if not LOG_FILE.exists() and not rotated_segments(LOG_FILE):
     st.error("No logs found. Run queries first.")
     st.stop()
 
-rows = []
-with open(LOG_FILE, "r") as f:
-    for line in f:
-        rows.append(json.loads(line))
+# Only lines written since the previous page load are parsed
+indexer = LogIndexer()
+indexer.update()
 
-df = pd.json_normalize(rows)
+hourly = indexer.rollup("hour")
+minutely = indexer.rollup("minute")
 
-# Derived fields
-df["is_refusal"] = df["outcome"].str.startswith("REFUSED")
-df["has_error"] = df["outcome"].str.contains("ERROR", na=False)
+if hourly.empty:
+    st.error("No logs found. Run queries first.")
+    st.stop()
 
 # High-level metrics
-total_requests = len(df)
-refusal_rate = df["is_refusal"].mean()
-error_rate = df["has_error"].mean()
-avg_latency = df["latency_ms.total"].mean()
+total_requests = int(hourly["requests"].sum())
+refusal_rate = hourly["refusals"].sum() / total_requests
+error_rate = hourly["errors"].sum() / total_requests
+avg_latency = (hourly["total_mean"] * hourly["requests"]).sum() / total_requests
+cache_hit_rate = hourly["cache_hits"].sum() / total_requests
 
-col1, col2, col3, col4 = st.columns(4)
+col1, col2, col3, col4, col5 = st.columns(5)
 
 col1.metric("Total Requests", total_requests)
 col2.metric("Refusal Rate", f"{refusal_rate:.2%}")
 col3.metric("Error Rate", f"{error_rate:.2%}")
 col4.metric("Avg Latency (ms)", f"{avg_latency:.0f}")
+col5.metric("Cache Hit Rate", f"{cache_hit_rate:.2%}")
 
 st.divider()
 
 # Latency breakdown
-st.subheader("Latency Distribution")
-
-latency_df = df[[
-    "latency_ms.retrieval",
-    "latency_ms.generation",
-    "latency_ms.total"
-]]
+st.subheader("Latency Percentiles (per minute)")
 
-st.bar_chart(latency_df)
+recent = minutely[minutely["bucket"] >= minutely["bucket"].max() - pd.Timedelta(hours=RECENT_HOURS)]
+recent = recent.set_index("bucket")
 
-# Confidence vs Outcome
-st.subheader("Confidence vs Outcome")
+percentile = st.radio("Percentile", ["p50", "p95", "p99"], horizontal=True)
 
-confidence_df = df[~df["is_refusal"]][
-    ["confidence", "outcome"]
+latency_columns = [
+    f"retrieval_{percentile}",
+    f"generation_{percentile}",
+    f"total_{percentile}"
 ]
+# Time-to-first-token is only logged by the streaming endpoint
+if recent[f"ttft_{percentile}"].notna().any():
+    latency_columns.insert(2, f"ttft_{percentile}")
+
+st.line_chart(recent[latency_columns])
+
+# Requests and refusals over time
+st.subheader("Requests and Refusal Rate (per hour)")
+
+traffic_col1, traffic_col2 = st.columns(2)
+traffic_col1.bar_chart(hourly.set_index("bucket")["requests"])
+traffic_col2.line_chart(hourly.set_index("bucket")["refusal_rate"])
 
-if not confidence_df.empty:
-    st.scatter_chart(confidence_df, x="confidence", y="confidence")
+# Confidence over time
+st.subheader("Mean Confidence of Answered Queries (per hour)")
+
+if hourly["confidence_mean"].notna().any():
+    st.line_chart(hourly.set_index("bucket")["confidence_mean"])
 else:
     st.info("No answered queries yet.")
 
 # Refusal reasons
 st.subheader("Refusal Reasons")
 
-refusals = df[df["is_refusal"]]
+reason_columns = [c for c in hourly.columns if c.startswith("reason:")]
 
-if not refusals.empty:
+if reason_columns:
     refusal_counts = (
-        refusals["generation.refusal_reason"]
-        .value_counts()
+        hourly[reason_columns]
+        .sum()
+        .rename(lambda c: c.split(":", 1)[1])
         .rename_axis("reason")
         .reset_index(name="count")
     )
@@ -82,14 +98,30 @@ if not refusals.empty:
 else:
     st.info("No refusals logged.")
 
+# Pre-generation gate
+st.subheader("Pre-Generation Gate")
+
+gate_col1, gate_col2 = st.columns(2)
+gate_col1.metric(
+    "Refused Before Generation",
+    int(hourly["pre_generation_refusals"].sum())
+)
+gate_col2.metric(
+    "Generation Seconds Saved",
+    f"{hourly['generation_seconds_saved'].sum():.1f}"
+)
+
 # Cost tracking
 st.subheader("Cost")
 
 st.metric(
     "Total Cost",
-    f"${df['cost'].sum():.2f}"
+    f"${hourly['cost'].sum():.2f}"
 )
 
-# Raw logs for debugging
+# Raw logs for debugging, newest first
 with st.expander("View Raw Logs"):
-    st.dataframe(df)
+    total_rows = indexer.total_rows()
+    pages = max((total_rows + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+    page = st.number_input(f"Page (1–{pages})", min_value=1, max_value=pages, value=1)
+    st.dataframe(indexer.read_page(page - 1, PAGE_SIZE))
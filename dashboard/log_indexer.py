@@ -0,0 +1,356 @@
+import gzip
+import hashlib
+import json
+import os
+from itertools import groupby
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+
+LOG_FILE = Path("logs/requests.jsonl")
+INDEX_DIR = Path("logs/index")
+
+STATE_FILE = "state.json"
+PARTS_DIR = "rows"
+ROLLUP_FILES = {"minute": "rollup_minute.parquet", "hour": "rollup_hour.parquet"}
+ROLLUP_FREQ = {"minute": "min", "hour": "h"}
+
+# Parts written by each run are merged into one file per closed hour, and
+# hour files into one per closed day, so the part store stays a few dozen files
+COMPACT_FREQ = {"hour": "h", "day": "D"}
+
+LATENCY_STAGES = ["retrieval", "generation", "ttft", "total"]
+PERCENTILES = {"p50": 0.50, "p95": 0.95, "p99": 0.99}
+
+# Nested values that do not map onto flat columns are kept as JSON strings
+LIST_COLUMNS = ["retrieval.retrieved_docs", "trace"]
+
+
+def rotated_segments(path: Path = LOG_FILE) -> List[Path]:
+    # Mirrors app.logging.structured_logger.rotated_segments without starting its writer
+    return sorted(path.parent.glob(f"{path.stem}.*{path.suffix}*"))
+
+
+def _segment_name(segment: Path) -> str:
+    # A segment is briefly present both plain and gzipped while it is compressed
+    return segment.name[:-3] if segment.suffix == ".gz" else segment.name
+
+
+def _file_identity(f) -> str:
+    """
+    Inode plus a hash of the first line. Inodes alone get reused once a rotated
+    segment is compressed and deleted, so they cannot tell files apart.
+    """
+    f.seek(0)
+    head = f.readline()
+    return f"{os.fstat(f.fileno()).st_ino}:{hashlib.sha1(head).hexdigest()}"
+
+
+def _read_complete_lines(f, offset: int):
+    """
+    Complete lines after `offset`, and the offset just past the last one.
+    A partially written trailing line is left for the next run.
+    """
+    f.seek(offset)
+    data = f.read()
+    end = data.rfind(b"\n") + 1
+    lines = [line for line in data[:end].split(b"\n") if line.strip()]
+    return lines, offset + end
+
+
+def _write_parquet(df: pd.DataFrame, path: Path):
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _rollup(rows: pd.DataFrame, freq: str) -> pd.DataFrame:
+    grouped = rows.groupby(rows["timestamp"].dt.floor(freq))
+
+    rollup = pd.DataFrame({
+        "requests": grouped.size(),
+        "refusals": grouped["is_refusal"].sum(),
+        "errors": grouped["has_error"].sum(),
+        "cache_hits": grouped["cache_hit"].sum(),
+        "pre_generation_refusals": grouped["pre_generation"].sum(),
+        "generation_seconds_saved": grouped["generation_seconds_saved"].sum(),
+        "cost": grouped["cost"].sum(),
+        "confidence_mean": grouped["answered_confidence"].mean()
+    })
+    rollup["refusal_rate"] = rollup["refusals"] / rollup["requests"]
+
+    for stage in LATENCY_STAGES:
+        column = f"latency_ms.{stage}"
+        rollup[f"{stage}_mean"] = grouped[column].mean()
+        for name, q in PERCENTILES.items():
+            rollup[f"{stage}_{name}"] = grouped[column].quantile(q)
+
+    reasons = rows[rows["is_refusal"]]
+    if not reasons.empty:
+        reason_counts = (
+            reasons.groupby([reasons["timestamp"].dt.floor(freq), "generation.refusal_reason"])
+            .size()
+            .unstack(fill_value=0)
+        )
+        reason_counts.columns = [f"reason:{reason}" for reason in reason_counts.columns]
+        rollup = rollup.join(reason_counts)
+
+    return rollup.rename_axis("bucket").reset_index()
+
+
+class LogIndexer:
+    """
+    Incrementally indexes the structured request log for the dashboard.
+
+    Remembers how far it has read (byte offset in the active file plus which
+    rotated segments are done), appends only new rows to a Parquet part
+    store that is compacted into hourly and daily files, and recomputes the per-minute and per-hour rollups for just the
+    buckets those rows touch. Dashboard page loads therefore cost the same
+    whatever the total log size.
+    """
+
+    def __init__(self, log_file: Path = LOG_FILE, index_dir: Path = INDEX_DIR):
+        self.log_file = Path(log_file)
+        self.index_dir = Path(index_dir)
+        self.parts_dir = self.index_dir / PARTS_DIR
+        self.parts_dir.mkdir(parents=True, exist_ok=True)
+        self.state = self._load_state()
+
+    def _load_state(self) -> dict:
+        path = self.index_dir / STATE_FILE
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"active_file": None, "active_offset": 0, "segments_done": [], "parts": [], "next_part": 0}
+
+    def _save_state(self):
+        path = self.index_dir / STATE_FILE
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_segment(segment: Path, offset: int) -> List[bytes]:
+        # Prefer the plain file, which is complete as soon as it is renamed;
+        # fall back to the gzip copy once compression has removed it
+        for path, opener in ((segment, open), (segment.with_name(f"{segment.name}.gz"), gzip.open)):
+            try:
+                with opener(path, "rb") as f:
+                    return _read_complete_lines(f, offset)[0]
+            except FileNotFoundError:
+                continue
+        return []
+
+    def _collect_new_lines(self) -> List[bytes]:
+        lines = []
+        existing = {_segment_name(segment) for segment in rotated_segments(self.log_file)}
+        # segments removed by retention can never be listed again
+        self.state["segments_done"] = [name for name in self.state["segments_done"] if name in existing]
+        pending = sorted(existing - set(self.state["segments_done"]))
+
+        # Segments are listed before the active file is opened, so a rotation
+        # in between shows up as a changed identity with no unseen segment
+        try:
+            active = open(self.log_file, "rb")
+        except FileNotFoundError:
+            active = None
+
+        try:
+            active_file = _file_identity(active) if active is not None else None
+            rotated = self.state["active_file"] is not None and active_file != self.state["active_file"]
+            if rotated and not pending:
+                return []
+
+            for name in pending:
+                # segments rotate in order, so the oldest unseen one is the file we were tailing
+                offset = self.state["active_offset"] if rotated else 0
+                rotated = False
+                lines.extend(self._read_segment(self.log_file.with_name(name), offset))
+                self.state["segments_done"].append(name)
+
+            if active is not None:
+                offset = self.state["active_offset"] if active_file == self.state["active_file"] else 0
+                active_lines, offset = _read_complete_lines(active, offset)
+                lines.extend(active_lines)
+                self.state["active_file"] = active_file
+                self.state["active_offset"] = offset
+            else:
+                self.state["active_file"] = None
+                self.state["active_offset"] = 0
+        finally:
+            if active is not None:
+                active.close()
+
+        return lines
+
+    @staticmethod
+    def _normalize(lines: List[bytes]) -> pd.DataFrame:
+        df = pd.json_normalize([json.loads(line) for line in lines])
+
+        for column in LIST_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].map(json.dumps)
+
+        df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+        df["is_refusal"] = df["outcome"].str.startswith("REFUSED")
+        df["has_error"] = df["outcome"].str.contains("ERROR", na=False)
+        df["pre_generation"] = df["outcome"] == "REFUSED_PRE_GENERATION"
+
+        # Fields added over time are missing from older log lines
+        defaults = {
+            "cache_hit": False,
+            "gate.generation_seconds_saved": 0.0,
+            "cost": 0.0,
+            "confidence": None,
+            "generation.refusal_reason": None
+        }
+        for column, default in defaults.items():
+            if column not in df.columns:
+                df[column] = default
+        for stage in LATENCY_STAGES:
+            if f"latency_ms.{stage}" not in df.columns:
+                df[f"latency_ms.{stage}"] = None
+            df[f"latency_ms.{stage}"] = pd.to_numeric(df[f"latency_ms.{stage}"], errors="coerce")
+
+        df["cache_hit"] = df["cache_hit"].fillna(False).astype(bool)
+        df["generation_seconds_saved"] = pd.to_numeric(df["gate.generation_seconds_saved"], errors="coerce").fillna(0.0)
+        df["cost"] = pd.to_numeric(df["cost"], errors="coerce").fillna(0.0)
+        df["answered_confidence"] = pd.to_numeric(df["confidence"], errors="coerce").where(~df["is_refusal"])
+
+        return df
+
+    def read_rows(self, since: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+        parts = [
+            part for part in self.state["parts"]
+            if since is None or pd.Timestamp(part["max_ts"]) >= since
+        ]
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat(
+            [pd.read_parquet(self.parts_dir / part["file"]) for part in parts],
+            ignore_index=True
+        )
+
+    def _update_rollups(self, new_rows: pd.DataFrame):
+        for name, freq in ROLLUP_FREQ.items():
+            touched = set(new_rows["timestamp"].dt.floor(freq))
+            since = min(touched)
+
+            recent = self.read_rows(since)
+            recent = recent[recent["timestamp"].dt.floor(freq).isin(touched)]
+            recomputed = _rollup(recent, freq)
+
+            path = self.index_dir / ROLLUP_FILES[name]
+            if path.exists():
+                existing = pd.read_parquet(path)
+                existing = existing[~existing["bucket"].isin(touched)]
+                recomputed = pd.concat([existing, recomputed], ignore_index=True)
+
+            _write_parquet(recomputed.sort_values("bucket").reset_index(drop=True), path)
+
+    def _new_part_file(self, level: str) -> str:
+        # state files written before compaction have no counter
+        number = self.state.get("next_part", len(self.state["parts"]))
+        self.state["next_part"] = number + 1
+        return f"{level}-{number:06d}.parquet"
+
+    def _compact(self) -> List[str]:
+        """
+        Merge consecutive parts whose newest rows fall in the same closed hour,
+        then those in the same closed day. Returns the files that were merged,
+        to be deleted once the new state is saved.
+        """
+        merged_files = []
+        newest = max(pd.Timestamp(part["max_ts"]) for part in self.state["parts"])
+
+        levels = list(COMPACT_FREQ)
+        for position, (level, freq) in enumerate(COMPACT_FREQ.items()):
+            current = newest.floor(freq)
+            parts = []
+            for bucket, group in groupby(self.state["parts"], key=lambda part: pd.Timestamp(part["max_ts"]).floor(freq)):
+                group = list(group)
+                # the open hour (day) still gets parts; a lone file already at this level or above is done
+                if bucket >= current or (len(group) == 1 and group[0].get("level") in levels[position:]):
+                    parts.extend(group)
+                    continue
+
+                rows = pd.concat([pd.read_parquet(self.parts_dir / part["file"]) for part in group], ignore_index=True)
+                part_file = self._new_part_file(level)
+                _write_parquet(rows, self.parts_dir / part_file)
+                parts.append({
+                    "file": part_file,
+                    "level": level,
+                    "rows": len(rows),
+                    "min_ts": min(part["min_ts"] for part in group),
+                    "max_ts": max(part["max_ts"] for part in group)
+                })
+                merged_files.extend(part["file"] for part in group)
+            self.state["parts"] = parts
+
+        return merged_files
+
+    def update(self) -> int:
+        """
+        Index log lines written since the last run; returns the number of new rows.
+        """
+        lines = self._collect_new_lines()
+        if not lines:
+            self._save_state()
+            return 0
+
+        new_rows = self._normalize(lines)
+
+        part_file = self._new_part_file("part")
+        _write_parquet(new_rows, self.parts_dir / part_file)
+        self.state["parts"].append({
+            "file": part_file,
+            "level": "part",
+            "rows": len(new_rows),
+            "min_ts": new_rows["timestamp"].min().isoformat(),
+            "max_ts": new_rows["timestamp"].max().isoformat()
+        })
+
+        self._update_rollups(new_rows)
+        merged_files = self._compact()
+        self._save_state()
+        for part_file in merged_files:
+            (self.parts_dir / part_file).unlink(missing_ok=True)
+        return len(new_rows)
+
+    def rollup(self, name: str) -> pd.DataFrame:
+        path = self.index_dir / ROLLUP_FILES[name]
+        if not path.exists():
+            return pd.DataFrame()
+        return pd.read_parquet(path)
+
+    def total_rows(self) -> int:
+        return sum(part["rows"] for part in self.state["parts"])
+
+    def read_page(self, page: int, page_size: int) -> pd.DataFrame:
+        """
+        Newest-first page of raw rows, reading only the parts that overlap it.
+        """
+        total = self.total_rows()
+        end = total - page * page_size
+        start = max(end - page_size, 0)
+        if end <= 0:
+            return pd.DataFrame()
+
+        frames = []
+        position = 0
+        for part in self.state["parts"]:
+            part_start, part_end = position, position + part["rows"]
+            position = part_end
+            if part_end <= start or part_start >= end:
+                continue
+            rows = pd.read_parquet(self.parts_dir / part["file"])
+            frames.append(rows.iloc[max(start - part_start, 0):end - part_start])
+
+        return pd.concat(frames, ignore_index=True).iloc[::-1].reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    indexer = LogIndexer()
+    print(f"Indexed {indexer.update()} new rows ({indexer.total_rows()} total)")
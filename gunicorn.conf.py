@@ -0,0 +1,24 @@
+# Multi-worker serving: gunicorn -c gunicorn.conf.py app.main:app
+import multiprocessing
+import os
+
+workers = int(os.getenv("VERIFAI_WORKERS", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.getenv("VERIFAI_BIND", "0.0.0.0:8000")
+# generation can take a while on a busy Ollama
+timeout = 120
+
+# Import the app once in the master and fork workers from it, so the embedding
+# model weights are shared copy-on-write instead of loaded once per worker
+preload_app = True
+os.environ.setdefault("VERIFAI_PRELOAD_MODEL", "1")
+
+# The memory-mapped matrix is shared through the page cache and avoids every
+# worker opening its own SQLite connection to the Chroma store
+os.environ.setdefault("VERIFAI_RETRIEVER_BACKEND", "matrix")
+
+# Split the cores between workers rather than letting each use all of them;
+# these must be set before torch / onnxruntime are imported
+threads_per_worker = str(max(1, multiprocessing.cpu_count() // workers))
+os.environ.setdefault("OMP_NUM_THREADS", threads_per_worker)
+os.environ.setdefault("VERIFAI_ONNX_INTRA_OP_THREADS", threads_per_worker)
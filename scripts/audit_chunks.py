@@ -1,13 +1,18 @@
 import json
 from pathlib import Path
 from collections import defaultdict
+from scripts.dedupe_chunks import NearDuplicateIndex
 
 CHUNKS_FILE = Path("data/chunks/chunks.json")
+DUPLICATES_FILE = Path("data/chunks/duplicates.json")
 
 # threshold
 MIN_CHARS = 200
 MAX_CHARS = 2500
 
+# Kept chunks at least this similar are listed as near misses of deduplication
+NEAR_MISS_THRESHOLD = 0.5
+
 
 def load_chunks():
     with open(CHUNKS_FILE, "r", encoding="utf-8") as f:
@@ -23,6 +28,24 @@ def has_section_header(text: str) -> bool:
     )
 
 
+def load_duplicates():
+    if not DUPLICATES_FILE.exists():
+        return None
+    with open(DUPLICATES_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def near_misses(chunks):
+    """
+    Pairs of kept chunks that are similar, but below the threshold that
+    would have collapsed them.
+    """
+    index = NearDuplicateIndex(NEAR_MISS_THRESHOLD)
+    for chunk in chunks:
+        index.add(chunk)
+    return sorted(index.pairs, key=lambda pair: -pair["similarity"])
+
+
 def audit():
     chunks = load_chunks()
 
@@ -77,6 +100,28 @@ def audit():
     for c in no_header[:3]:
         print(f"  - {c['chunk_id']}")
 
+    # near-duplicates
+    canonical = [c for c in chunks if c.get("duplicate_chunk_ids")]
+    collapsed = sum(len(c["duplicate_chunk_ids"]) for c in canonical)
+    cross_document = [c for c in canonical if len(c.get("sources", [])) > 1]
+
+    print("\n===== NEAR-DUPLICATES =====")
+
+    print(f"\nChunks collapsed at ingestion: {collapsed} into {len(canonical)} canonical chunks "
+          f"({len(cross_document)} spanning several documents)")
+    for c in canonical[:3]:
+        print(f"  - {c['chunk_id']} <- {', '.join(c['duplicate_chunk_ids'])} ({'; '.join(c.get('sources', []))})")
+
+    report = load_duplicates()
+    if report and report["pairs"]:
+        lowest = min(pair["similarity"] for pair in report["pairs"])
+        print(f"Lowest similarity collapsed: {lowest} (threshold {report['threshold']})")
+
+    misses = near_misses(chunks)
+    print(f"\nKept chunks at least {NEAR_MISS_THRESHOLD} similar: {len(misses)}")
+    for pair in misses[:3]:
+        print(f"  - {pair['duplicate']} ~ {pair['canonical']} ({pair['similarity']})")
+
     print("\n===== AUDIT COMPLETE =====\n")
 
 
@@ -0,0 +1,103 @@
+import argparse
+import json
+from pathlib import Path
+import requests
+
+API_URL = "http://127.0.0.1:8000/query/batch"
+
+# Questions sent per /query/batch call; also the checkpoint granularity
+BATCH_SIZE = 200
+CONCURRENCY = 4
+
+
+def load_questions(path: Path):
+    """
+    Accepts a JSON list (strings or objects with "question" and optional "id",
+    e.g. data/evaluation/evaluation.json) or JSONL with one such item per line.
+    Items without an id are numbered by position.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.suffix == ".json":
+            items = json.load(f)
+        else:
+            items = [json.loads(line) for line in f if line.strip()]
+
+    questions = []
+    for idx, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"question": item}
+        questions.append({"id": str(item.get("id", idx)), "question": item["question"]})
+    return questions
+
+
+def load_checkpoint(output_path: Path) -> set:
+    """
+    The output file doubles as the checkpoint: every complete line is a finished
+    question. A partially written last line (from a kill mid-write) is truncated.
+    """
+    if not output_path.exists():
+        return set()
+
+    done = set()
+    valid_bytes = 0
+    with open(output_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                done.add(json.loads(line)["id"])
+            except (json.JSONDecodeError, KeyError):
+                break
+            valid_bytes += len(line)
+
+    with open(output_path, "r+b") as f:
+        f.truncate(valid_bytes)
+
+    return done
+
+
+def run_batch(batch, out_file, api_url: str, concurrency: int):
+    resp = requests.post(
+        api_url,
+        json={"questions": [q["question"] for q in batch], "concurrency": concurrency},
+        stream=True,
+        timeout=None
+    )
+    resp.raise_for_status()
+
+    for line in resp.iter_lines():
+        if not line:
+            continue
+        record = json.loads(line)
+        record = {"id": batch[record.pop("index")]["id"], **record}
+        out_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out_file.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions through /query/batch")
+    parser.add_argument("input", type=Path, help="JSON or JSONL file of questions")
+    parser.add_argument("output", type=Path, help="JSONL file of answers (resumed if it exists)")
+    parser.add_argument("--api-url", default=API_URL)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    args = parser.parse_args()
+
+    questions = load_questions(args.input)
+    done = load_checkpoint(args.output)
+    pending = [q for q in questions if q["id"] not in done]
+
+    print(f"Loaded {len(questions)} questions, {len(done)} already answered, {len(pending)} to go")
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as out_file:
+        for start in range(0, len(pending), args.batch_size):
+            batch = pending[start:start + args.batch_size]
+            run_batch(batch, out_file, args.api_url, args.concurrency)
+            print(f"Answered {len(done) + start + len(batch)}/{len(questions)}")
+
+    print(f"Saved answers to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+CHUNKS_FILE = Path("data/chunks/chunks.json")
+EVALUATION_FILE = Path("data/evaluation/evaluation.json")
+
+SINGLE_QUERY_RUNS = 200
+BATCH_SIZE = 32
+# Chunk texts are repeated up to this many to get a stable throughput number
+THROUGHPUT_TEXTS = 512
+
+
+def rss_mb() -> float:
+    # current resident set size; ru_maxrss only gives the peak
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(backend: str, threads: int) -> dict:
+    """
+    Measure one backend in this (fresh) process, so RSS reflects only it.
+    """
+    if threads:
+        os.environ["VERIFAI_ONNX_INTRA_OP_THREADS"] = str(threads)
+    baseline = rss_mb()
+
+    from app.retrieval.embedding_backend import load_embedder
+
+    start = time.perf_counter()
+    embedder = load_embedder(backend)
+    if threads and backend == "torch":
+        import torch
+        torch.set_num_threads(threads)
+    load_seconds = time.perf_counter() - start
+    loaded = rss_mb()
+
+    with open(EVALUATION_FILE, "r", encoding="utf-8") as f:
+        questions = [case["question"] for case in json.load(f)]
+    with open(CHUNKS_FILE, "r", encoding="utf-8") as f:
+        chunks = [chunk["text"] for chunk in json.load(f)]
+
+    # first calls allocate buffers and pick kernels; keep them out of the numbers
+    embedder.encode(questions[:1])
+    embedder.encode(chunks[:BATCH_SIZE], batch_size=BATCH_SIZE)
+
+    latencies = []
+    for i in range(SINGLE_QUERY_RUNS):
+        start = time.perf_counter()
+        embedder.encode([questions[i % len(questions)]], batch_size=1)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    texts = (chunks * (THROUGHPUT_TEXTS // max(len(chunks), 1) + 1))[:THROUGHPUT_TEXTS]
+    start = time.perf_counter()
+    embedder.encode(texts, batch_size=BATCH_SIZE)
+    batch_seconds = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "backend": backend,
+        "embedder": embedder.name,
+        "threads": threads or "default",
+        "load_seconds": round(load_seconds, 3),
+        "single_query_ms": {"p50": round(p50, 2), "p95": round(p95, 2), "p99": round(p99, 2)},
+        "batch_texts_per_second": round(len(texts) / batch_seconds, 1),
+        "rss_model_mb": round(loaded - baseline, 1),
+        "rss_peak_mb": round(peak_rss_mb(), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends for latency and memory")
+    parser.add_argument("--backends", default="torch,onnx")
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads (0 = library default)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.threads)))
+        return
+
+    results = []
+    for backend in args.backends.split(","):
+        completed = subprocess.run(
+            [sys.executable, "-m", "scripts.benchmark_embeddings", "--worker", backend, "--threads", str(args.threads)],
+            capture_output=True,
+            text=True
+        )
+        if completed.returncode != 0:
+            print(f"{backend}: failed\n{completed.stderr.strip()}")
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(f"{'backend':<8} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'texts/s':>9} {'model MB':>9} {'peak MB':>8}")
+    for r in results:
+        q = r["single_query_ms"]
+        print(
+            f"{r['backend']:<8} {r['load_seconds']:>7} {q['p50']:>8} {q['p95']:>8} {q['p99']:>8} "
+            f"{r['batch_texts_per_second']:>9} {r['rss_model_mb']:>9} {r['rss_peak_mb']:>8}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
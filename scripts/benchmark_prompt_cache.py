@@ -0,0 +1,162 @@
+import argparse
+import json
+import time
+from itertools import cycle, islice
+from pathlib import Path
+
+import numpy as np
+import requests
+
+from app.models.generator import (
+    OLLAMA_BACKENDS,
+    OLLAMA_MODEL,
+    OLLAMA_TIMEOUT,
+    OLLAMA_URL,
+    build_prompt,
+    ollama_request,
+    ollama_settings,
+    ollama_usage
+)
+from app.retrieval.lexical import tokenize
+
+CHUNKS_FILE = Path("data/chunks/chunks.json")
+EVALUATION_FILE = Path("data/evaluation/evaluation.json")
+
+TOP_K = 3
+
+# A load_duration above this means the model was (re)loaded, not just touched
+RELOAD_THRESHOLD_MS = 100
+
+# The prompt as it was built before the system prefix, keep_alive and num_ctx
+# handling: one string per request, instructions first, no options
+LEGACY_TEMPLATE = """
+    Instructions:
+    - You are an AI assistant.
+    - Answer the question using ONLY the provided context.
+    - Do NOT use any prior knowledge.
+    - If the answer is not in the context, state that you do not have enough information.
+    - Answer ONLY what is necessary to directly answer the question.
+    - Do not include additional policy information unless it is explicitly required.
+    - After any sentence that comes from a specific chunk, include a citation like [ID: chunk_id].
+    - If multiple chunks support the same point, cite all relevant IDs, e.g., [ID: chunk1, chunk2].
+    - Do NOT fabricate information or make assumptions.
+    - If the context does not provide the answer, say exactly: "I do not have enough information in the provided context."
+
+    CONTEXT:
+    {context}
+
+    QUESTION:
+    {query}
+    """
+
+
+def lexical_top_k(question: str, chunks, k: int):
+    """
+    Chunks sharing the most terms with the question; stands in for retrieval so
+    the benchmark needs neither the embedding model nor the index.
+    """
+    terms = set(tokenize(question))
+    ranked = sorted(chunks, key=lambda chunk: -len(terms & set(tokenize(chunk["text"]))))[:k]
+    return [
+        (chunk["text"], 1.0, {key: chunk.get(key) for key in ("chunk_id", "source", "token_count")})
+        for chunk in ranked
+    ]
+
+
+def legacy_request(question: str, retrieved_chunks):
+    context = "\n\n".join(f"[ID: {meta['chunk_id']}]\n{text}" for text, _, meta in retrieved_chunks)
+    payload = {
+        "model": OLLAMA_MODEL,
+        "prompt": LEGACY_TEMPLATE.format(context=context, query=question),
+        "stream": False
+    }
+    return OLLAMA_URL, payload, {"api": "generate", "num_ctx": None, "keep_alive": None}
+
+
+def current_request(question: str, retrieved_chunks):
+    # unpacked, so both modes send the same context and only the prompt handling differs
+    prompt, _, _ = build_prompt(question, retrieved_chunks, budget=0)
+    settings = ollama_settings(prompt)
+    path, payload = ollama_request(prompt, OLLAMA_MODEL, stream=False, settings=settings)
+    # talks to one server directly, like the legacy mode
+    return OLLAMA_BACKENDS[0] + path, payload, settings
+
+
+MODES = {"legacy": legacy_request, "current": current_request}
+
+
+def unload():
+    requests.post(OLLAMA_URL, json={"model": OLLAMA_MODEL, "keep_alive": 0}, timeout=OLLAMA_TIMEOUT)
+
+
+def run_mode(mode: str, questions, chunks, idle: float) -> dict:
+    # every mode starts from an unloaded model
+    unload()
+
+    rows = []
+    for i, question in enumerate(questions):
+        if i and idle:
+            time.sleep(idle)
+        url, payload, settings = MODES[mode](question, lexical_top_k(question, chunks, TOP_K))
+        start = time.perf_counter()
+        response = requests.post(url, json=payload, timeout=OLLAMA_TIMEOUT)
+        response.raise_for_status()
+        usage = ollama_usage(response.json())
+        rows.append({
+            **usage,
+            "num_ctx": settings["num_ctx"],
+            "wall_ms": round((time.perf_counter() - start) * 1000, 1)
+        })
+
+    def percentile(field, p):
+        values = [row[field] for row in rows[1:] if row[field] is not None]
+        return round(float(np.percentile(values, p)), 1) if values else None
+
+    return {
+        "mode": mode,
+        "requests": len(rows),
+        "cold_load_ms": rows[0]["load_ms"] if rows else None,
+        "reloads_after_first": sum(1 for row in rows[1:] if (row["load_ms"] or 0) > RELOAD_THRESHOLD_MS),
+        # warm requests only; the first one pays the load
+        "prompt_eval_ms_p50": percentile("prompt_eval_ms", 50),
+        "prompt_eval_ms_p95": percentile("prompt_eval_ms", 95),
+        "prompt_tokens_evaluated_p50": percentile("prompt_tokens", 50),
+        "wall_ms_p50": percentile("wall_ms", 50),
+        "rows": rows
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare Ollama load and prompt-eval time for the legacy and current prompt handling"
+    )
+    parser.add_argument("--modes", default="legacy,current")
+    parser.add_argument("--questions", type=int, default=20, help="questions sent per mode")
+    parser.add_argument("--idle", type=float, default=0.0,
+                        help="seconds between requests; above 300 shows Ollama's default unload")
+    parser.add_argument("--output", type=Path, help="write the results, including per-request rows, as JSON")
+    args = parser.parse_args()
+
+    with open(CHUNKS_FILE, "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+    with open(EVALUATION_FILE, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    # the evaluation set is small; repeat it to reach the requested count
+    questions = list(islice(cycle(case["question"] for case in cases), args.questions))
+
+    results = [run_mode(mode, questions, chunks, args.idle) for mode in args.modes.split(",")]
+
+    print(f"{'mode':<8} {'cold load ms':>13} {'reloads':>8} {'eval p50':>9} {'eval p95':>9} {'eval tok':>9} {'wall p50':>9}")
+    for r in results:
+        print(
+            f"{r['mode']:<8} {r['cold_load_ms']!s:>13} {r['reloads_after_first']:>8} {r['prompt_eval_ms_p50']!s:>9} "
+            f"{r['prompt_eval_ms_p95']!s:>9} {r['prompt_tokens_evaluated_p50']!s:>9} {r['wall_ms_p50']!s:>9}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
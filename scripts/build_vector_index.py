@@ -1,14 +1,37 @@
 import json
+import os
 from pathlib import Path
 import chromadb
-from sentence_transformers import SentenceTransformer
+from app.models.context_packer import count_tokens
+from app.retrieval.embedding_backend import EMBEDDING_MODEL, embedder_name, load_embedder
+from app.retrieval.embedding_cache import EmbeddingCache
+from app.retrieval.lexical import LEXICAL_INDEX_FILE, BM25Builder
+from app.retrieval.matrix_index import MATRIX_DIR, export_matrix
+from scripts.chunk_documents import content_hash
 
 CHUNKS_FILE = Path("data/chunks/chunks.json")
 CHROMA_DIR = Path("chroma_db")
 COLLECTION_NAME = "intern_policies"
+COLLECTION_METADATA = {"description": "Intern onboarding and policy documents"}
 
-# Load embedding model 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+# dtype of the exported matrix used by the "matrix" retriever backend
+MATRIX_DTYPE = os.getenv("VERIFAI_INDEX_DTYPE", "float32")
+
+# Chroma rejects very large single writes
+UPSERT_BATCH_SIZE = 1000
+
+# Embedding model, loaded only when something actually needs embedding
+_model = None
+
+# Chunks that were embedded before (e.g. a reverted edit) are served from disk
+embedding_cache = EmbeddingCache(embedder_name())
+
+
+def load_model():
+    global _model
+    if _model is None:
+        _model = load_embedder()
+    return _model
 
 
 def load_chunks():
@@ -16,47 +39,226 @@ def load_chunks():
         return json.load(f)
 
 
-def main():
-    print("Loading chunks...")
-    chunks = load_chunks()
-    print(f"Loaded {len(chunks)} chunks")
-
-    print("Initializing Chroma PersistentClient...")
+def open_collection():
     client = chromadb.PersistentClient(
         path=str(CHROMA_DIR)
     )
 
-    collection = client.get_or_create_collection(
+    return client.get_or_create_collection(
         name=COLLECTION_NAME,
-        metadata={"description": "Intern onboarding and policy documents"}
+        metadata=COLLECTION_METADATA
     )
 
-    print("Embedding and storing chunks...")
 
-    texts = [chunk["text"] for chunk in chunks]
-    embeddings = model.encode(texts, show_progress_bar=True)
+def stored_embedder(meta: dict) -> str:
+    # vectors stored before the embedder was recorded came from the torch model
+    return (meta or {}).get("embedder") or EMBEDDING_MODEL
+
+
+def record_embedder(collection):
+    """
+    Stamp the collection with the embedder of its vectors, checked by the
+    Retriever against its query embedder. Call once a sync has finished, when
+    every stored vector comes from the current embedder.
+    """
+    collection.modify(metadata={**COLLECTION_METADATA, "embedder": embedder_name()})
+
+
+def duplicate_metadata(chunk: dict) -> dict:
+    # Chroma metadata holds scalars only, so the lists are joined
+    duplicates = chunk.get("duplicate_chunk_ids", [])
+    return {
+        # every document the text appears in, near-duplicates included
+        "sources": "; ".join(chunk.get("sources") or [chunk["source"]]),
+        "duplicate_chunk_ids": ", ".join(duplicates),
+        "duplicate_count": len(duplicates)
+    }
+
+
+def chunk_metadata(chunk: dict) -> dict:
+    return {
+        "doc_id": chunk["doc_id"],
+        "chunk_id": chunk["chunk_id"],
+        "source": chunk["source"],
+        # chunks.json written before hashing was added has no content_hash
+        "content_hash": chunk.get("content_hash") or content_hash(chunk["text"]),
+        "token_count": chunk.get("token_count") or count_tokens(chunk["text"]),
+        # vectors from different embedders must never be compared
+        "embedder": embedder_name(),
+        **duplicate_metadata(chunk)
+    }
+
+
+def load_existing_hashes(collection) -> dict:
+    existing = collection.get(include=["metadatas"])
+    current = embedder_name()
+    # chunks stored before token counts were kept get no hash, so they are
+    # re-upserted (from the embedding cache) with the current metadata; so are
+    # chunks embedded by another backend, which are re-embedded
+    return {
+        chunk_id: (meta or {}).get("content_hash")
+        if "token_count" in (meta or {}) and stored_embedder(meta) == current else None
+        for chunk_id, meta in zip(existing["ids"], existing["metadatas"])
+    }
+
+
+def upsert_chunks(collection, chunks, existing_hashes: dict) -> dict:
+    """
+    Embed and upsert the chunks in `chunks` that are new or whose content hash
+    differs from the stored one.
+    """
+    to_embed = []
+    added = updated = unchanged = 0
+    for chunk in chunks:
+        metadata = chunk_metadata(chunk)
+
+        if chunk["chunk_id"] not in existing_hashes:
+            added += 1
+        elif existing_hashes[chunk["chunk_id"]] != metadata["content_hash"]:
+            updated += 1
+        else:
+            unchanged += 1
+            continue
+        to_embed.append((chunk, metadata))
+
+    for start in range(0, len(to_embed), UPSERT_BATCH_SIZE):
+        batch = to_embed[start:start + UPSERT_BATCH_SIZE]
+        texts = [chunk["text"] for chunk, _ in batch]
+        embeddings = embedding_cache.encode(
+            texts,
+            lambda missing: load_model().encode(missing, show_progress_bar=len(missing) > 100)
+        )
+
+        collection.upsert(
+            ids=[chunk["chunk_id"] for chunk, _ in batch],
+            documents=texts,
+            embeddings=embeddings.tolist(),
+            metadatas=[metadata for _, metadata in batch]
+        )
+
+    return {"added": added, "updated": updated, "unchanged": unchanged}
+
+
+def delete_stale_chunks(collection, existing_hashes: dict, current_ids: set) -> int:
+    deleted_ids = [chunk_id for chunk_id in existing_hashes if chunk_id not in current_ids]
 
-    ids = [chunk["chunk_id"] for chunk in chunks]
-    metadatas = [
-        {
-            "doc_id": chunk["doc_id"],
-            "chunk_id": chunk["chunk_id"],
-            "source": chunk["source"]
-        }
-        for chunk in chunks
-    ]
+    for start in range(0, len(deleted_ids), UPSERT_BATCH_SIZE):
+        collection.delete(ids=deleted_ids[start:start + UPSERT_BATCH_SIZE])
 
-    collection.add(
+    return len(deleted_ids)
+
+
+def sync_duplicate_metadata(collection, groups: dict) -> int:
+    """
+    Bring the near-duplicate fields of stored chunks up to date without
+    re-embedding: set them on canonical chunks whose duplicates changed and
+    clear them on chunks that no longer have any. `groups` maps canonical
+    chunk_id to its "sources" and "duplicate_chunk_ids".
+    """
+    wanted = {chunk_id: duplicate_metadata(group) for chunk_id, group in groups.items()}
+    stored = collection.get(where={"duplicate_count": {"$gt": 0}}, include=["metadatas"])
+    current = dict(zip(stored["ids"], stored["metadatas"]))
+
+    updates = {
+        chunk_id: duplicate_metadata({"source": meta["source"]})
+        for chunk_id, meta in current.items()
+        if chunk_id not in wanted
+    }
+    for chunk_id, fields in wanted.items():
+        if any(current.get(chunk_id, {}).get(key) != value for key, value in fields.items()):
+            updates[chunk_id] = fields
+
+    ids = list(updates)
+    for start in range(0, len(ids), UPSERT_BATCH_SIZE):
+        batch = ids[start:start + UPSERT_BATCH_SIZE]
+        collection.update(ids=batch, metadatas=[updates[chunk_id] for chunk_id in batch])
+
+    return len(ids)
+
+
+def sync_collection(collection, chunks) -> dict:
+    """
+    Make the collection match `chunks`: embed and upsert only new or changed
+    chunks (by content hash) and delete chunks that no longer exist.
+    Safe to re-run; an unchanged corpus embeds nothing.
+    """
+    existing_hashes = load_existing_hashes(collection)
+
+    summary = upsert_chunks(collection, chunks, existing_hashes)
+    summary["deleted"] = delete_stale_chunks(
+        collection,
+        existing_hashes,
+        {chunk["chunk_id"] for chunk in chunks}
+    )
+    summary["duplicates_updated"] = sync_duplicate_metadata(
+        collection,
+        {chunk["chunk_id"]: chunk for chunk in chunks if chunk.get("duplicate_chunk_ids")}
+    )
+    record_embedder(collection)
+    return summary
+
+
+def export_collection_matrix(collection, chunk_ids):
+    # Re-export from the stored vectors so unchanged chunks are never re-embedded
+    stored = collection.get(include=["embeddings", "documents", "metadatas"])
+    rows = {
+        chunk_id: (doc, embedding, meta)
+        for chunk_id, doc, embedding, meta in zip(
+            stored["ids"], stored["documents"], stored["embeddings"], stored["metadatas"]
+        )
+    }
+    ids = [chunk_id for chunk_id in chunk_ids if chunk_id in rows]
+
+    # the manifest names the model that produced the stored vectors
+    embedders = {stored_embedder(rows[chunk_id][2]) for chunk_id in ids}
+    if len(embedders) > 1:
+        raise ValueError(f"Collection mixes vectors from several embedders: {sorted(embedders)}")
+    model_name = embedders.pop() if embedders else embedder_name()
+
+    export_matrix(
         ids=ids,
-        documents=texts,
-        embeddings=embeddings.tolist(),
-        metadatas=metadatas
+        documents=[rows[chunk_id][0] for chunk_id in ids],
+        embeddings=[rows[chunk_id][1] for chunk_id in ids],
+        metadatas=[rows[chunk_id][2] for chunk_id in ids],
+        model_name=model_name,
+        dtype=MATRIX_DTYPE
     )
 
-    print("\nEmbedding complete")
-    print(f"Stored {len(ids)} vectors in collection '{COLLECTION_NAME}'")
+
+def main():
+    print("Loading chunks...")
+    chunks = load_chunks()
+    print(f"Loaded {len(chunks)} chunks")
+
+    print("Initializing Chroma PersistentClient...")
+    collection = open_collection()
+
+    print("Syncing chunks with the collection...")
+    summary = sync_collection(collection, chunks)
+
+    print("\nIndex sync complete")
+    print(
+        f"Added: {summary['added']}, updated: {summary['updated']}, "
+        f"deleted: {summary['deleted']}, unchanged: {summary['unchanged']}, "
+        f"duplicate metadata updated: {summary['duplicates_updated']}"
+    )
+    print(f"Collection '{COLLECTION_NAME}' now holds {collection.count()} vectors")
     print(f"Persistence directory: {CHROMA_DIR.resolve()}")
+    cache_stats = embedding_cache.stats()
+    print(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+
+    changed = summary["added"] or summary["updated"] or summary["deleted"] or summary["duplicates_updated"]
+    if changed or not (MATRIX_DIR / "manifest.json").exists():
+        export_collection_matrix(collection, [chunk["chunk_id"] for chunk in chunks])
+        print(f"Exported {MATRIX_DTYPE} embedding matrix to {MATRIX_DIR.resolve()}")
+
+    # BM25 is cheap to rebuild and depends on corpus-wide statistics, so always rebuild it
+    lexical_index = BM25Builder()
+    for chunk in chunks:
+        lexical_index.add(chunk["chunk_id"], chunk["text"])
+    lexical_index.save()
+    print(f"Saved BM25 index ({len(lexical_index.vocab)} terms) to {LEXICAL_INDEX_FILE.resolve()}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
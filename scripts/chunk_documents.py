@@ -1,12 +1,17 @@
+import hashlib
 import json
 import re
 from pathlib import Path
+from app.models.context_packer import count_tokens
+from scripts.dedupe_chunks import deduplicate_chunks, save_report
 
 PROCESSED_DIR = Path("data/processed")
 CHUNKS_DIR = Path("data/chunks")
 CHUNKS_DIR.mkdir(parents=True, exist_ok=True)
 
 OUTPUT_FILE = CHUNKS_DIR / "chunks.json"
+# near-duplicate chunks collapsed at chunking time
+DUPLICATES_FILE = CHUNKS_DIR / "duplicates.json"
 
 # Quality threshold
 MIN_CHARS = 200
@@ -32,6 +37,10 @@ def is_section_header(line: str) -> bool:
     return False
 
 
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
 def chunk_document(text: str, doc_id: str, source: str):
     lines = text.split("\n")
 
@@ -73,11 +82,15 @@ def chunk_document(text: str, doc_id: str, source: str):
     # finalise chunks
     final_chunks = []
     for idx, chunk in enumerate(merged_chunks):
+        chunk_text = f"{chunk['header']}\n{chunk['body']}".strip()
         final_chunks.append({
             "doc_id": doc_id,
             "chunk_id": f"{doc_id}_{idx}",
-            "text": f"{chunk['header']}\n{chunk['body']}".strip(),
-            "source": source
+            "text": chunk_text,
+            "source": source,
+            "content_hash": content_hash(chunk_text),
+            # lets the context packer budget prompt tokens without re-tokenizing
+            "token_count": count_tokens(chunk_text)
         })
 
     return final_chunks
@@ -102,10 +115,15 @@ def main():
         all_chunks.extend(document_chunks)
         print(f"Chunked {file_path.name}: {len(document_chunks)} chunks")
 
+    # the same clause repeated across documents is kept once, listing every source
+    all_chunks, duplicates = deduplicate_chunks(all_chunks)
+    save_report(duplicates, DUPLICATES_FILE)
+    print(f"\nCollapsed {len(duplicates.pairs)} near-duplicate chunks into {len(duplicates.groups)}")
+
     with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
         json.dump(all_chunks, f, indent=2, ensure_ascii=False)
 
-    print(f"\nSaved {len(all_chunks)} chunks into {OUTPUT_FILE}")
+    print(f"Saved {len(all_chunks)} chunks into {OUTPUT_FILE}")
 
 
 if __name__ == "__main__":
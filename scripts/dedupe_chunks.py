@@ -0,0 +1,162 @@
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.retrieval.lexical import tokenize
+
+# Estimated Jaccard similarity (of word shingles) at which two chunks are the
+# same clause; 0 keeps every chunk
+DEDUP_THRESHOLD = float(os.getenv("VERIFAI_DEDUP_THRESHOLD", "0.8"))
+
+# Shingles are runs of this many (stopword-free) words; short enough that a
+# one-word edit in a two-sentence clause still leaves it above the threshold
+SHINGLE_WORDS = 3
+
+# MinHash signature length; the estimate's standard error is about 1/sqrt(NUM_PERM)
+NUM_PERM = 128
+
+# Fixed so signatures, and therefore the chosen canonical chunks, are stable across runs
+SEED = 1
+
+_rng = np.random.default_rng(SEED)
+# multiply-shift hashing: (a * x + b) mod 2**64, top 32 bits; a must be odd
+_A = _rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text: str) -> List[str]:
+    words = tokenize(text)
+    if len(words) <= SHINGLE_WORDS:
+        return [" ".join(words)]
+    return [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    # section headers are numbered and titled per document, so only the body counts
+    header, _, body = text.partition("\n")
+    hashes = np.array(
+        [zlib.crc32(shingle.encode("utf-8")) for shingle in set(shingles(body or header))],
+        dtype=np.uint64
+    )
+    with np.errstate(over="ignore"):
+        permuted = (hashes[:, None] * _A + _B) >> np.uint64(32)
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def lsh_bands(threshold: float, num_perm: int = NUM_PERM) -> int:
+    """
+    Number of LSH bands. Two signatures become candidates with probability
+    1 - (1 - s**rows)**bands, an S-curve centred near (1/bands)**(1/rows); pick
+    the sharpest split whose centre still sits below the threshold, so true
+    duplicates are rarely missed and few false candidates need checking.
+    """
+    splits = [bands for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+    below = [bands for bands in splits if (1 / bands) ** (bands / num_perm) <= threshold - 0.05]
+    return min(below) if below else num_perm
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(a == b))
+
+
+class NearDuplicateIndex:
+    """
+    Streaming MinHash/LSH near-duplicate detector. Chunks are added one at a
+    time; each is looked up in the band buckets of the canonical chunks seen
+    so far and either becomes canonical itself or is folded into the most
+    similar candidate. Work per chunk is one signature plus the candidates in
+    its buckets, so a corpus is deduplicated in roughly linear time, and only
+    signatures (not texts) are kept.
+
+    `groups` maps each canonical chunk_id that absorbed duplicates to the
+    fields its metadata gains: every source and the collapsed chunk ids.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, num_perm: int = NUM_PERM):
+        self.threshold = threshold
+        self.bands = lsh_bands(threshold, num_perm)
+        self.rows = num_perm // self.bands
+
+        self.buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        self.signatures: List[np.ndarray] = []
+        self.canonical: List[Tuple[str, str]] = []
+        self.groups: Dict[str, Dict] = {}
+        self.pairs: List[Dict] = []
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def find(self, signature: np.ndarray) -> Tuple[Optional[int], float]:
+        candidates = {i for key in self._band_keys(signature) for i in self.buckets.get(key, ())}
+        best, best_similarity = None, 0.0
+        for i in candidates:
+            value = similarity(signature, self.signatures[i])
+            if value > best_similarity:
+                best, best_similarity = i, value
+        if best_similarity >= self.threshold:
+            return best, best_similarity
+        return None, best_similarity
+
+    def add(self, chunk: Dict) -> Optional[str]:
+        """
+        Record one chunk. Returns the chunk_id of the canonical chunk it
+        duplicates, or None if it is kept.
+        """
+        if self.threshold <= 0:
+            return None
+
+        signature = minhash_signature(chunk["text"])
+        match, value = self.find(signature)
+
+        if match is None:
+            index = len(self.signatures)
+            self.signatures.append(signature)
+            self.canonical.append((chunk["chunk_id"], chunk["source"]))
+            for key in self._band_keys(signature):
+                self.buckets.setdefault(key, []).append(index)
+            return None
+
+        canonical_id, canonical_source = self.canonical[match]
+        group = self.groups.setdefault(canonical_id, {"sources": [canonical_source], "duplicate_chunk_ids": []})
+        if chunk["source"] not in group["sources"]:
+            group["sources"].append(chunk["source"])
+        group["duplicate_chunk_ids"].append(chunk["chunk_id"])
+        self.pairs.append({
+            "canonical": canonical_id,
+            "duplicate": chunk["chunk_id"],
+            "similarity": round(value, 3)
+        })
+        return canonical_id
+
+
+def apply_group(chunk: Dict, groups: Dict[str, Dict]) -> Dict:
+    group = groups.get(chunk["chunk_id"])
+    if group is not None:
+        chunk["sources"] = list(group["sources"])
+        chunk["duplicate_chunk_ids"] = list(group["duplicate_chunk_ids"])
+    return chunk
+
+
+def deduplicate_chunks(chunks: List[Dict], threshold: float = DEDUP_THRESHOLD) -> Tuple[List[Dict], NearDuplicateIndex]:
+    """
+    Collapse near-duplicate chunks into the first occurrence (in input order).
+    Returns the kept chunks, canonical ones carrying `sources` and
+    `duplicate_chunk_ids`, and the index with the matched pairs.
+    """
+    index = NearDuplicateIndex(threshold)
+    kept = [chunk for chunk in chunks if index.add(chunk) is None]
+    return [apply_group(chunk, index.groups) for chunk in kept], index
+
+
+def save_report(index: NearDuplicateIndex, path: Path):
+    """
+    Every collapsed chunk, the canonical chunk it was folded into and their
+    estimated similarity; read by scripts/audit_chunks.py.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"threshold": index.threshold, "pairs": index.pairs}, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,96 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from app.retrieval.embedding_backend import load_embedder
+
+CHUNKS_FILE = Path("data/chunks/chunks.json")
+EVALUATION_FILE = Path("data/evaluation/evaluation.json")
+
+K_VALUES = (1, 3, 5, 10)
+
+# Defaults for the pass/fail verdict; int8 MiniLM normally clears both easily
+MIN_MEAN_COSINE = 0.99
+MIN_OVERLAP_AT_3 = 0.9
+
+
+def load_texts(chunks_path: Path, questions_path: Path):
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        chunks = [chunk["text"] for chunk in json.load(f)]
+    with open(questions_path, "r", encoding="utf-8") as f:
+        questions = [case["question"] for case in json.load(f)]
+    return chunks, questions
+
+
+def normalize(matrix) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+def top_k(queries: np.ndarray, index: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(queries @ index.T), axis=1)[:, :k]
+
+
+def overlap(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """
+    Mean fraction of the reference top-k that the candidate also returns.
+    """
+    k = reference.shape[1]
+    shared = [len(set(a) & set(b)) / k for a, b in zip(reference, candidate)]
+    return round(float(np.mean(shared)), 4) if shared else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ONNX embeddings against the PyTorch reference")
+    parser.add_argument("--chunks", type=Path, default=CHUNKS_FILE)
+    parser.add_argument("--questions", type=Path, default=EVALUATION_FILE)
+    parser.add_argument("--min-mean-cosine", type=float, default=MIN_MEAN_COSINE)
+    parser.add_argument("--min-overlap-at-3", type=float, default=MIN_OVERLAP_AT_3)
+    args = parser.parse_args()
+
+    chunks, questions = load_texts(args.chunks, args.questions)
+    # chunk texts double as queries, so the overlap check has more than a handful of cases
+    queries = questions + chunks
+
+    reference = load_embedder("torch")
+    candidate = load_embedder("onnx")
+
+    ref_chunks = normalize(reference.encode(chunks))
+    cand_chunks = normalize(candidate.encode(chunks))
+    ref_queries = normalize(reference.encode(queries))
+    cand_queries = normalize(candidate.encode(queries))
+
+    cosines = np.sum(ref_chunks * cand_chunks, axis=1)
+    report = {
+        "chunks": len(chunks),
+        "queries": len(queries),
+        "cosine": {
+            "mean": round(float(cosines.mean()), 5),
+            "min": round(float(cosines.min()), 5),
+            "p1": round(float(np.percentile(cosines, 1)), 5)
+        },
+        # fully ONNX: queries and index both re-embedded
+        "overlap_onnx_index": {},
+        # ONNX queries against an index still built with PyTorch
+        "overlap_torch_index": {}
+    }
+
+    for k in K_VALUES:
+        k = min(k, len(chunks))
+        expected = top_k(ref_queries, ref_chunks, k)
+        report["overlap_onnx_index"][k] = overlap(expected, top_k(cand_queries, cand_chunks, k))
+        report["overlap_torch_index"][k] = overlap(expected, top_k(cand_queries, ref_chunks, k))
+
+    print(json.dumps(report, indent=2))
+
+    overlap_at_3 = report["overlap_onnx_index"][min(3, len(chunks))]
+    passed = report["cosine"]["mean"] >= args.min_mean_cosine and overlap_at_3 >= args.min_overlap_at_3
+    print("PASS" if passed else "FAIL")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
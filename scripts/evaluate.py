@@ -1,48 +1,189 @@
+import argparse
 import json
 import csv
 import requests
 import time
 
+import numpy as np
+
 API_URL = "http://127.0.0.1:8000/query"
+EVALUATION_FILE = "data/evaluation/evaluation.json"
+
+# k values scored by --offline; retrieval runs once at the largest
+OFFLINE_K_VALUES = "1,3,5,10"
+
+
+def run_online(cases):
+    results = []
+
+    for case in cases:
+        start = time.time()
+        resp = requests.post(API_URL, json={"question": case["question"]})
+        data = resp.json()
+        latency = time.time() - start
+
+        answer = data.get("answer")
+        sources = data.get("sources", [])
+        confidence = data.get("confidence", 0)
+
+        grounded = all(
+            any(
+                chunk_id.startswith(exp)
+                for chunk_id in [src["id"]] + src.get("duplicate_ids", [])
+                for exp in case["expected_sources"]
+            )
+            for src in sources
+        ) if case["expected_sources"] else True
+
+        faithful = not (answer is not None and case["acceptable_refusal"])
+        refusal_correct = (
+            answer is None if case["acceptable_refusal"] else answer is not None
+        )
+
+        results.append({
+            "id": case["id"],
+            "grounded": grounded,
+            "faithful": faithful,
+            "refusal_correct": refusal_correct,
+            "confidence": confidence,
+            "latency": round(latency, 3),
+            "answered": answer is not None
+        })
+
+    with open("evaluation_results.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=results[0].keys())
+        writer.writeheader()
+        writer.writerows(results)
+
+    print("Evaluation complete. Saved to evaluation_results.csv")
+
+
+def source_hits(retrieved, cases) -> np.ndarray:
+    """
+    (cases, max_k, max_expected) boolean array: whether the chunk at each rank
+    comes from each expected source document, counting the documents of
+    near-duplicates collapsed into it. Padding never matches.
+    """
+    documents = {}
+
+    def code(doc_id):
+        return documents.setdefault(doc_id, len(documents))
+
+    def chunk_documents(meta):
+        duplicates = meta.get("duplicate_chunk_ids")
+        doc_ids = [meta.get("doc_id") or meta.get("chunk_id", "").rsplit("_", 1)[0]]
+        doc_ids += [chunk_id.rsplit("_", 1)[0] for chunk_id in duplicates.split(", ")] if duplicates else []
+        return [code(doc_id) for doc_id in dict.fromkeys(doc_ids)]
+
+    max_k = max((len(chunks) for chunks in retrieved), default=0)
+    max_expected = max((len(case["expected_sources"]) for case in cases), default=0)
+    per_chunk = [[chunk_documents(meta) for _, _, meta in chunks] for chunks in retrieved]
+    max_docs = max((len(docs) for chunks in per_chunk for docs in chunks), default=1)
+
+    retrieved_docs = np.full((len(cases), max_k, max_docs), -1)
+    expected_docs = np.full((len(cases), max(max_expected, 1)), -2)
+    for i, (chunks, case) in enumerate(zip(per_chunk, cases)):
+        for rank, docs in enumerate(chunks):
+            retrieved_docs[i, rank, :len(docs)] = docs
+        expected_docs[i, :len(case["expected_sources"])] = [code(doc) for doc in case["expected_sources"]]
+
+    return (retrieved_docs[:, :, :, None] == expected_docs[:, None, None, :]).any(axis=2)
 
-with open("data/evaluation/evaluation.json") as f:
-    cases = json.load(f)
 
-results = []
+def run_offline(cases, k_values, output_path: str):
+    """
+    Retrieval-only regression: no server, no LLM. All questions are embedded in
+    one batch and retrieved once at the largest k; every smaller k is a prefix
+    of that ranking.
+    """
+    from app.retrieval.retriever import Retriever
+    from app.guardrails.refusal import should_refuse_before_generation
+
+    max_k = max(k_values)
+    questions = [case["question"] for case in cases]
+
+    start = time.time()
+    retriever = Retriever()
+    load_time = time.time() - start
 
-for case in cases:
     start = time.time()
-    resp = requests.post(API_URL, json={"question": case["question"]})
-    data = resp.json()
-    latency = time.time() - start
-
-    answer = data.get("answer")
-    sources = data.get("sources", [])
-    confidence = data.get("confidence", 0)
-
-    grounded = all(
-        any(src["id"].startswith(exp) for exp in case["expected_sources"])
-        for src in sources
-    ) if case["expected_sources"] else True
-
-    faithful = not (answer is not None and case["acceptable_refusal"])
-    refusal_correct = (
-        answer is None if case["acceptable_refusal"] else answer is not None
-    )
-
-    results.append({
-        "id": case["id"],
-        "grounded": grounded,
-        "faithful": faithful,
-        "refusal_correct": refusal_correct,
-        "confidence": confidence,
-        "latency": round(latency, 3),
-        "answered": answer is not None
-    })
-
-with open("evaluation_results.csv", "w", newline="") as f:
-    writer = csv.DictWriter(f, fieldnames=results[0].keys())
-    writer.writeheader()
-    writer.writerows(results)
-
-print("Evaluation complete. Saved to evaluation_results.csv")
+    embeddings = retriever.embed_batch(questions)
+    retrieved = retriever.search_batch(embeddings, top_k=max_k, queries=questions)
+    retrieval_time = time.time() - start
+    retriever.close()
+
+    hits = source_hits(retrieved, cases)
+    answerable = np.array([bool(case["expected_sources"]) for case in cases])
+    should_refuse = np.array([case["acceptable_refusal"] for case in cases])
+    expected_count = np.array([len(case["expected_sources"]) for case in cases])
+
+    # rank (1-based) of the first relevant chunk, 0 if none was retrieved
+    any_hit = hits.any(axis=2)
+    first_rank = np.where(any_hit.any(axis=1), any_hit.argmax(axis=1) + 1, 0)
+
+    summary = {
+        "cases": len(cases),
+        "answerable_cases": int(answerable.sum()),
+        "refusal_cases": int(should_refuse.sum()),
+        "index_load_seconds": round(load_time, 3),
+        "retrieval_seconds": round(retrieval_time, 3),
+        "retrieval": retriever.retrieval_info(),
+        "k": {}
+    }
+
+    for k in k_values:
+        top_hits = any_hit[:, :k].any(axis=1)
+        covered = hits[:, :k, :].any(axis=1).sum(axis=1)
+        reciprocal_rank = np.where((first_rank > 0) & (first_rank <= k), 1.0 / np.maximum(first_rank, 1), 0.0)
+        # the guardrail itself decides, so offline numbers track the server exactly
+        would_refuse = np.array([should_refuse_before_generation(chunks[:k], retriever.cosine) for chunks in retrieved])
+
+        def rate(values, mask):
+            return round(float(values[mask].mean()), 4) if mask.any() else None
+
+        summary["k"][k] = {
+            "recall": rate(top_hits, answerable),
+            "source_recall": round(float(covered[answerable].sum() / max(expected_count[answerable].sum(), 1)), 4),
+            "mrr": rate(reciprocal_rank, answerable),
+            "would_refuse": round(float(would_refuse.mean()), 4),
+            "false_refusal_rate": rate(would_refuse, ~should_refuse),
+            "correct_refusal_rate": rate(would_refuse, should_refuse)
+        }
+
+    print(f"Retrieved {len(cases)} cases at k={max_k} in {retrieval_time:.2f}s "
+          f"(index load {load_time:.2f}s)")
+    print(f"{'k':>4} {'recall':>8} {'src_rec':>8} {'mrr':>8} {'refuse':>8} {'false_ref':>10} {'correct_ref':>12}")
+    for k, scores in summary["k"].items():
+        print(f"{k:>4} " + " ".join(
+            f"{'-' if scores[name] is None else format(scores[name], '.3f'):>{width}}"
+            for name, width in [
+                ("recall", 8), ("source_recall", 8), ("mrr", 8), ("would_refuse", 8),
+                ("false_refusal_rate", 10), ("correct_refusal_rate", 12)
+            ]
+        ))
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Saved retrieval evaluation to {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate VerifAI against the evaluation set")
+    parser.add_argument("--cases", default=EVALUATION_FILE)
+    parser.add_argument("--offline", action="store_true",
+                        help="score retrieval in-process (recall@k, MRR, refusals) without the API or LLM")
+    parser.add_argument("--k", default=OFFLINE_K_VALUES, help="comma-separated k values for --offline")
+    parser.add_argument("--output", default="evaluation_retrieval.json", help="summary file for --offline")
+    args = parser.parse_args()
+
+    with open(args.cases) as f:
+        cases = json.load(f)
+
+    if args.offline:
+        run_offline(cases, sorted({int(k) for k in args.k.split(",")}), args.output)
+    else:
+        run_online(cases)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import json
+from pathlib import Path
+
+from app.retrieval.embedding_backend import (
+    EMBEDDING_MODEL,
+    ONNX_CONFIG_FILE,
+    ONNX_MODEL_DIR,
+    ONNX_MODEL_FILE,
+    ONNX_TOKENIZER_FILE
+)
+
+# all-MiniLM-L6-v2 truncates inputs at 256 word pieces
+MAX_SEQ_LENGTH = 256
+OPSET = 17
+
+FP32_MODEL_FILE = "model.fp32.onnx"
+
+
+def export(model_name: str, output_dir: Path, max_seq_length: int):
+    """
+    Export the transformer behind the SentenceTransformer model to ONNX, then
+    apply int8 dynamic quantization to its weights. Pooling and normalisation
+    stay in Python (OnnxEmbedder), exactly as SentenceTransformer does them.
+    Needs torch, transformers, onnx and onnxruntime; serving needs only the last.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    hub_name = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    tokenizer = AutoTokenizer.from_pretrained(hub_name)
+    model = AutoModel.from_pretrained(hub_name).eval()
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    fp32_path = output_dir / FP32_MODEL_FILE
+
+    sample = tokenizer(["an example sentence", "another one"], padding=True, return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=OPSET
+        )
+
+    quantize_dynamic(
+        str(fp32_path),
+        str(output_dir / ONNX_MODEL_FILE),
+        weight_type=QuantType.QInt8
+    )
+
+    # the fast tokenizer's tokenizer.json is all OnnxEmbedder needs to tokenize
+    tokenizer.backend_tokenizer.save(str(output_dir / ONNX_TOKENIZER_FILE))
+
+    with open(output_dir / ONNX_CONFIG_FILE, "w", encoding="utf-8") as f:
+        json.dump({
+            "model": model_name,
+            "quantization": "int8",
+            "max_seq_length": max_seq_length,
+            "pad_token_id": tokenizer.pad_token_id
+        }, f, indent=2)
+
+    fp32_size = fp32_path.stat().st_size / 1e6
+    int8_size = (output_dir / ONNX_MODEL_FILE).stat().st_size / 1e6
+    print(f"Exported {model_name} to {output_dir}: fp32 {fp32_size:.1f} MB -> int8 {int8_size:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to int8 ONNX for VERIFAI_EMBEDDING_BACKEND=onnx")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--output-dir", type=Path, default=ONNX_MODEL_DIR)
+    parser.add_argument("--max-seq-length", type=int, default=MAX_SEQ_LENGTH)
+    args = parser.parse_args()
+
+    export(args.model, args.output_dir, args.max_seq_length)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from scripts.clean_documents import RAW_DIR, PROCESSED_DIR, clean_document
+from scripts.chunk_documents import DUPLICATES_FILE, OUTPUT_FILE, chunk_document
+from scripts.build_vector_index import (
+    CHROMA_DIR,
+    COLLECTION_NAME,
+    MATRIX_DTYPE,
+    delete_stale_chunks,
+    embedding_cache,
+    export_collection_matrix,
+    load_existing_hashes,
+    open_collection,
+    record_embedder,
+    sync_duplicate_metadata,
+    upsert_chunks
+)
+from scripts.dedupe_chunks import NearDuplicateIndex, apply_group, save_report
+from app.retrieval.lexical import LEXICAL_INDEX_FILE, BM25Builder
+from app.retrieval.matrix_index import MATRIX_DIR
+
+# Chunks are embedded and written to the index in batches of this size
+EMBED_BATCH_SIZE = 256
+
+# Files handed to the pool ahead of the one currently being consumed;
+# bounds memory while keeping every worker busy
+FILES_IN_FLIGHT_PER_WORKER = 4
+
+
+def process_file(path: Path):
+    """
+    Clean and chunk one raw document. Runs in a worker process.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        cleaned_text = clean_document(f.read())
+
+    with open(PROCESSED_DIR / path.name, "w", encoding="utf-8") as f:
+        f.write(cleaned_text)
+
+    return chunk_document(
+        text=cleaned_text,
+        doc_id=path.stem,
+        source=path.name
+    )
+
+
+def iter_document_chunks(files, workers: int):
+    """
+    Yield each file's chunks in input order, keeping at most a fixed number of
+    files queued in the process pool.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        files = iter(files)
+
+        for path in files:
+            pending.append((path, executor.submit(process_file, path)))
+            if len(pending) >= workers * FILES_IN_FLIGHT_PER_WORKER:
+                break
+
+        while pending:
+            path, future = pending.popleft()
+            next_path = next(files, None)
+            if next_path is not None:
+                pending.append((next_path, executor.submit(process_file, next_path)))
+            yield path, future.result()
+
+
+class ChunkFileWriter:
+    """
+    Streams chunks into chunks.json (same layout as chunk_documents.py)
+    without holding the whole list in memory.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.tmp_path = path.with_name(f"{path.name}.tmp")
+        self.file = open(self.tmp_path, "w", encoding="utf-8")
+        self.file.write("[")
+        self.count = 0
+
+    @staticmethod
+    def _format(chunk: dict) -> str:
+        return "  " + json.dumps(chunk, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+
+    def write(self, chunk: dict):
+        self.file.write(("," if self.count else "") + "\n" + self._format(chunk))
+        self.count += 1
+
+    def close(self, groups: dict = None):
+        """
+        Finish the file. Canonical chunks were written before their
+        near-duplicates turned up, so when `groups` is given their entries
+        are rewritten with the duplicate fields.
+        """
+        self.file.write("\n]" if self.count else "]")
+        self.file.close()
+
+        if groups:
+            self._apply_groups(groups)
+
+        os.replace(self.tmp_path, self.path)
+
+    def _apply_groups(self, groups: dict):
+        # copy entry by entry (each starts at a "  {" line and ends at "  }"
+        # or "  },", as written above) so memory stays bounded by one chunk
+        grouped_path = self.path.with_name(f"{self.path.name}.grouped.tmp")
+        with open(self.tmp_path, "r", encoding="utf-8") as src, open(grouped_path, "w", encoding="utf-8") as dst:
+            entry = []
+            for line in src:
+                if not entry and line.rstrip("\n") != "  {":
+                    dst.write(line)
+                    continue
+                entry.append(line)
+                if line.rstrip("\n") in ("  }", "  },"):
+                    dst.write(self._regroup("".join(entry), groups))
+                    entry = []
+        os.replace(grouped_path, self.tmp_path)
+
+    def _regroup(self, entry: str, groups: dict) -> str:
+        body = entry.rstrip("\n")
+        separator = "," if body.endswith(",") else ""
+        chunk = json.loads(body[:len(body) - len(separator)])
+        if chunk["chunk_id"] not in groups:
+            return entry
+        return self._format(apply_group(chunk, groups)) + separator + entry[len(body):]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean, chunk, embed and index raw documents in one pass")
+    parser.add_argument("--raw-dir", type=Path, default=RAW_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--embed-batch-size", type=int, default=EMBED_BATCH_SIZE)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    files = sorted(args.raw_dir.glob("*.txt"))
+    print(f"Found {len(files)} documents in {args.raw_dir}")
+
+    collection = open_collection()
+    existing_hashes = load_existing_hashes(collection)
+
+    chunk_writer = ChunkFileWriter(OUTPUT_FILE)
+    lexical_index = BM25Builder()
+    duplicates = NearDuplicateIndex()
+    summary = {"added": 0, "updated": 0, "unchanged": 0}
+    chunk_ids = []
+    batch = []
+    docs_done = 0
+
+    def flush():
+        counts = upsert_chunks(collection, batch, existing_hashes)
+        for key, value in counts.items():
+            summary[key] += value
+        batch.clear()
+
+    for path, chunks in iter_document_chunks(files, max(1, args.workers)):
+        for chunk in chunks:
+            # the same clause seen earlier (in any document) is indexed once
+            if duplicates.add(chunk) is not None:
+                continue
+            chunk_writer.write(chunk)
+            lexical_index.add(chunk["chunk_id"], chunk["text"])
+            chunk_ids.append(chunk["chunk_id"])
+            batch.append(chunk)
+            if len(batch) >= args.embed_batch_size:
+                flush()
+
+        docs_done += 1
+        if docs_done % 1000 == 0:
+            rate = docs_done / (time.time() - start_time)
+            print(f"Processed {docs_done}/{len(files)} documents ({rate:.1f} docs/sec)")
+
+    if batch:
+        flush()
+    chunk_writer.close(duplicates.groups)
+    save_report(duplicates, DUPLICATES_FILE)
+
+    summary["deleted"] = delete_stale_chunks(collection, existing_hashes, set(chunk_ids))
+    summary["duplicates_updated"] = sync_duplicate_metadata(collection, duplicates.groups)
+    record_embedder(collection)
+
+    changed = summary["added"] or summary["updated"] or summary["deleted"] or summary["duplicates_updated"]
+    if changed or not (MATRIX_DIR / "manifest.json").exists():
+        export_collection_matrix(collection, chunk_ids)
+        print(f"Exported {MATRIX_DTYPE} embedding matrix to {MATRIX_DIR.resolve()}")
+
+    lexical_index.save()
+    print(f"Saved BM25 index ({len(lexical_index.vocab)} terms) to {LEXICAL_INDEX_FILE.resolve()}")
+
+    elapsed = time.time() - start_time
+    cache_stats = embedding_cache.stats()
+
+    print("\nIngestion complete")
+    print(f"Documents: {docs_done} in {elapsed:.1f}s ({docs_done / max(elapsed, 1e-9):.1f} docs/sec)")
+    print(f"Saved {chunk_writer.count} chunks into {OUTPUT_FILE}")
+    print(f"Collapsed {len(duplicates.pairs)} near-duplicate chunks into {len(duplicates.groups)}")
+    print(
+        f"Added: {summary['added']}, updated: {summary['updated']}, "
+        f"deleted: {summary['deleted']}, unchanged: {summary['unchanged']}, "
+        f"duplicate metadata updated: {summary['duplicates_updated']}"
+    )
+    print(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    print(f"Collection '{COLLECTION_NAME}' in {CHROMA_DIR.resolve()} now holds {collection.count()} vectors")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+API_URL = "http://127.0.0.1:8000/query"
+QUESTIONS_FILE = Path("data/evaluation/evaluation.json")
+
+DURATION_SECONDS = 30.0
+REQUEST_TIMEOUT = 120.0
+
+# A level counts as saturated once throughput grows by less than this fraction
+SATURATION_GAIN = 0.05
+
+PERCENTILES = (50, 95, 99)
+
+
+def load_questions(path: Path) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        if path.suffix == ".json":
+            items = json.load(f)
+        else:
+            items = [json.loads(line) for line in f if line.strip()]
+    return [item if isinstance(item, str) else item["question"] for item in items]
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    stages = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        if name and params.startswith("dur="):
+            stages[name] = stages.get(name, 0.0) + float(params[4:])
+    return stages
+
+
+async def send_query(client: httpx.AsyncClient, api_url: str, question: str) -> dict:
+    start = time.perf_counter()
+    try:
+        resp = await client.post(api_url, json={"question": question})
+        latency_ms = (time.perf_counter() - start) * 1000
+        if resp.status_code != 200:
+            return {"ok": False, "latency_ms": latency_ms, "status": resp.status_code}
+        data = resp.json()
+        return {
+            "ok": True,
+            "latency_ms": latency_ms,
+            "refused": data.get("answer") is None,
+            "llm_error": "LLM error" in str(data.get("reason", "")),
+            "stages": parse_server_timing(resp.headers.get("server-timing"))
+        }
+    except httpx.HTTPError as e:
+        return {
+            "ok": False,
+            "latency_ms": (time.perf_counter() - start) * 1000,
+            "status": type(e).__name__
+        }
+
+
+async def run_closed_loop(api_url, questions, concurrency: int, duration: float) -> List[dict]:
+    """
+    `concurrency` clients each send their next request as soon as the last one returns.
+    """
+    results = []
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT, limits=limits) as client:
+        async def worker():
+            while time.perf_counter() < deadline:
+                results.append(await send_query(client, api_url, random.choice(questions)))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+async def run_open_loop(api_url, questions, rate: float, duration: float) -> List[dict]:
+    """
+    Poisson arrivals at `rate` requests/second regardless of how fast the server
+    answers, so queueing shows up as latency instead of lower offered load.
+    """
+    tasks = []
+    start = time.perf_counter()
+
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT, limits=httpx.Limits(max_connections=None)) as client:
+        next_arrival = start
+        while next_arrival - start < duration:
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send_query(client, api_url, random.choice(questions))))
+            next_arrival += random.expovariate(rate)
+        return list(await asyncio.gather(*tasks))
+
+
+def summarize(results: List[dict], elapsed: float) -> dict:
+    ok = [r for r in results if r["ok"]]
+    answered_or_refused = max(len(ok), 1)
+
+    def percentiles(values) -> dict:
+        if not values:
+            return {f"p{p}": None for p in PERCENTILES}
+        points = np.percentile(np.asarray(values), PERCENTILES)
+        return {f"p{p}": round(float(v), 1) for p, v in zip(PERCENTILES, points)}
+
+    stages = sorted({stage for r in ok for stage in r["stages"]})
+    return {
+        "requests": len(results),
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "error_rate": round(1 - len(ok) / max(len(results), 1), 4),
+        "llm_error_rate": round(sum(r["llm_error"] for r in ok) / answered_or_refused, 4),
+        "refusal_rate": round(sum(r["refused"] for r in ok) / answered_or_refused, 4),
+        "latency_ms": {
+            "client": percentiles([r["latency_ms"] for r in ok]),
+            **{
+                stage: percentiles([r["stages"][stage] for r in ok if stage in r["stages"]])
+                for stage in stages
+            }
+        }
+    }
+
+
+def print_summary(label: str, summary: dict):
+    print(f"\n== {label}")
+    print(
+        f"requests={summary['requests']} throughput={summary['throughput_rps']} req/s "
+        f"errors={summary['error_rate']:.2%} llm_errors={summary['llm_error_rate']:.2%} "
+        f"refusals={summary['refusal_rate']:.2%}"
+    )
+    print(f"{'stage':<16}" + "".join(f"{f'p{p} ms':>12}" for p in PERCENTILES))
+    for stage, values in summary["latency_ms"].items():
+        print(f"{stage:<16}" + "".join(f"{str(v):>12}" for v in values.values()))
+
+
+def find_saturation(levels: List[dict]) -> Optional[dict]:
+    """
+    First level whose throughput gain over the previous one drops below
+    SATURATION_GAIN: beyond it, extra load only adds queueing latency.
+    """
+    for previous, level in zip(levels, levels[1:]):
+        gain = (level["throughput_rps"] - previous["throughput_rps"]) / max(previous["throughput_rps"], 1e-9)
+        if gain < SATURATION_GAIN:
+            return previous
+    return None
+
+
+async def run_level(args, questions, level: float) -> dict:
+    start = time.perf_counter()
+    if args.mode == "rate":
+        results = await run_open_loop(args.api_url, questions, level, args.duration)
+    else:
+        results = await run_closed_loop(args.api_url, questions, int(level), args.duration)
+    summary = summarize(results, time.perf_counter() - start)
+    summary[args.mode] = level
+    return summary
+
+
+async def main_async(args):
+    questions = load_questions(args.questions)
+    levels = [float(level) for level in args.levels.split(",")]
+
+    summaries = []
+    for level in levels:
+        summary = await run_level(args, questions, level)
+        print_summary(f"{args.mode}={level:g}", summary)
+        summaries.append(summary)
+
+    report = {"mode": args.mode, "duration_seconds": args.duration, "levels": summaries}
+    if len(summaries) > 1:
+        saturation = find_saturation(summaries)
+        report["saturation"] = saturation[args.mode] if saturation else None
+        if saturation:
+            print(f"\nThroughput saturates at {args.mode}={saturation[args.mode]:g} "
+                  f"({saturation['throughput_rps']} req/s)")
+        else:
+            print("\nThroughput was still growing at the highest level tested")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved report to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive /query at fixed concurrency or arrival rate")
+    parser.add_argument("--api-url", default=API_URL)
+    parser.add_argument("--questions", type=Path, default=QUESTIONS_FILE)
+    parser.add_argument("--mode", choices=["concurrency", "rate"], default="concurrency",
+                        help="closed-loop clients or open-loop Poisson arrivals (req/s)")
+    parser.add_argument("--levels", default="1,2,4,8,16",
+                        help="comma-separated concurrency or rate levels, run in order")
+    parser.add_argument("--duration", type=float, default=DURATION_SECONDS, help="seconds per level")
+    parser.add_argument("--output", type=Path, help="write the full report as JSON")
+    args = parser.parse_args()
+
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
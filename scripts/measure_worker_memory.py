@@ -0,0 +1,62 @@
+import argparse
+import json
+from pathlib import Path
+
+# Fields of /proc/<pid>/smaps_rollup reported per process, in kB
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def memory(pid: int) -> dict:
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in FIELDS:
+                values[name] = round(int(rest.split()[0]) / 1024, 1)
+    return values
+
+
+def children(pid: int):
+    path = Path(f"/proc/{pid}/task/{pid}/children")
+    return [int(child) for child in path.read_text().split()] if path.exists() else []
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Per-worker memory of a gunicorn/uvicorn master and its workers (Linux only)"
+    )
+    parser.add_argument("pid", type=int, help="PID of the gunicorn or uvicorn master process")
+    parser.add_argument("--output", type=Path, help="write the measurements as JSON")
+    args = parser.parse_args()
+
+    processes = [("master", args.pid)] + [("worker", pid) for pid in children(args.pid)]
+    rows = [{"role": role, "pid": pid, **memory(pid)} for role, pid in processes]
+    workers = [row for row in rows if row["role"] == "worker"]
+
+    # PSS splits shared pages evenly between the processes mapping them, so it
+    # sums to the real footprint; RSS counts shared pages once per process
+    total = {
+        "processes": len(rows),
+        "workers": len(workers),
+        "rss_sum_mb": round(sum(row["Rss"] for row in rows), 1),
+        "pss_sum_mb": round(sum(row["Pss"] for row in rows), 1),
+        "private_per_worker_mb": round(
+            sum(row["Private_Clean"] + row["Private_Dirty"] for row in workers) / max(len(workers), 1), 1
+        )
+    }
+
+    print(f"{'role':<7} {'pid':>8} " + " ".join(f"{field:>14}" for field in FIELDS))
+    for row in rows:
+        print(f"{row['role']:<7} {row['pid']:>8} " + " ".join(f"{row[field]:>14.1f}" for field in FIELDS))
+    print(
+        f"\n{total['workers']} workers: PSS total {total['pss_sum_mb']} MB "
+        f"(RSS sum {total['rss_sum_mb']} MB), {total['private_per_worker_mb']} MB private per worker"
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"processes": rows, "total": total}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PORT = 11435
+
+# Rough token count for the prompt-eval timing; real tokenizers differ slightly
+CHARS_PER_TOKEN = 4
+
+REFUSAL = "I do not have enough information in the provided context."
+
+
+# Ollama's default when a request does not say how long to keep the model
+DEFAULT_KEEP_ALIVE_SECONDS = 300
+
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def keep_alive_seconds(value) -> float:
+    """
+    Ollama's keep_alive: seconds as a number, or a duration such as "30m".
+    Negative keeps the model loaded forever, 0 unloads it right away.
+    """
+    if value is None:
+        return DEFAULT_KEEP_ALIVE_SECONDS
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        match = re.fullmatch(r"(-?[0-9.]+)(ms|s|m|h)?", str(value).strip())
+        if not match:
+            return DEFAULT_KEEP_ALIVE_SECONDS
+        seconds = float(match.group(1)) * DURATION_UNITS[match.group(2) or "s"]
+    return float("inf") if seconds < 0 else seconds
+
+
+def shared_prefix(a: str, b: str) -> int:
+    return len(os.path.commonprefix([a, b]))
+
+
+class MockConfig:
+    """
+    Latency model for the stand-in: a model load when the model is not resident
+    (never loaded, idle past its keep_alive, or asked for a different num_ctx),
+    prompt evaluation at a fixed token rate for the part of the prompt not
+    already in a slot's KV cache, then completion tokens drawn from a normal
+    distribution and decoded at a rate drawn from a lognormal around --token-rate.
+    A --stall-rate share of requests first hangs for --stall-ms, the straggler
+    that hedged requests are meant to cut off.
+    """
+
+    def __init__(self, args):
+        self.load_ms = args.load_ms
+        self.load_every = args.load_every
+        self.prompt_rate = args.prompt_rate
+        self.tokens_mean = args.tokens_mean
+        self.tokens_stdev = args.tokens_stdev
+        self.token_rate = args.token_rate
+        self.token_rate_sigma = args.token_rate_sigma
+        self.error_rate = args.error_rate
+        self.refusal_rate = args.refusal_rate
+        self.stall_rate = args.stall_rate
+        self.stall_ms = args.stall_ms
+        self.max_parallel = args.max_parallel
+        self.prefix_cache = not args.no_prefix_cache
+
+        # Ollama serves a limited number of requests at once and queues the rest
+        self.slots = threading.BoundedSemaphore(args.max_parallel)
+        self._requests = 0
+        self._lock = threading.Lock()
+
+        # model residency, and the last prompt each parallel slot evaluated
+        self._loaded_until = 0.0
+        self._num_ctx = None
+        self._slot_prompts = [""] * args.max_parallel
+
+    def next_request(self) -> int:
+        with self._lock:
+            self._requests += 1
+            return self._requests
+
+    def needs_load(self, request_number: int, num_ctx) -> bool:
+        with self._lock:
+            expired = time.monotonic() > self._loaded_until
+            resized = num_ctx != self._num_ctx
+            self._num_ctx = num_ctx
+            if expired or resized:
+                # a reload starts with empty KV caches
+                self._slot_prompts = [""] * self.max_parallel
+        return expired or resized or bool(self.load_every and request_number % self.load_every == 0)
+
+    def keep_loaded(self, keep_alive):
+        with self._lock:
+            self._loaded_until = time.monotonic() + keep_alive_seconds(keep_alive)
+
+    def cached_chars(self, prompt: str) -> int:
+        """
+        Characters of the prompt already in a slot's KV cache; the prompt takes
+        over the slot that shares the longest prefix with it.
+        """
+        with self._lock:
+            shared = [shared_prefix(prompt, previous) for previous in self._slot_prompts]
+            slot = max(range(len(shared)), key=shared.__getitem__)
+            self._slot_prompts[slot] = prompt
+        return shared[slot] if self.prefix_cache else 0
+
+
+def user_text(body: dict, chat: bool) -> str:
+    # the system prompt's citation examples ([ID: chunk_id]) are not chunks
+    if chat:
+        return "".join(m.get("content", "") for m in body.get("messages", []) if m.get("role") == "user")
+    return body.get("prompt", "")
+
+
+def build_answer(prompt: str, tokens: int, refuse: bool) -> list:
+    """
+    Answer words citing chunk IDs from the user prompt, so the API's
+    confidence estimate behaves as it would with a real model.
+    """
+    if refuse:
+        return REFUSAL.split(" ")
+
+    chunk_ids = re.findall(r"\[ID: ([^\]]+)\]", prompt) or ["unknown"]
+    words = []
+    for i in range(tokens):
+        words.append("policy" if i % 12 else f"[ID: {chunk_ids[(i // 12) % len(chunk_ids)]}]")
+    return words
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: MockConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self.send_json(200, {"models": [{"name": "mock"}]})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path not in ("/api/generate", "/api/chat"):
+            self.send_json(404, {"error": "not found"})
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        chat = self.path == "/api/chat"
+        if chat:
+            prompt = "".join(message.get("content", "") for message in body.get("messages", []))
+        else:
+            prompt = body.get("system", "") + body.get("prompt", "")
+
+        config = self.config
+        if random.random() < config.error_rate:
+            self.send_json(500, {"error": "mock failure"})
+            return
+
+        if random.random() < config.stall_rate:
+            time.sleep(config.stall_ms / 1000)
+
+        with config.slots:
+            self.generate(body, prompt, chat)
+
+    def generate(self, body: dict, prompt: str, chat: bool):
+        config = self.config
+        request_number = config.next_request()
+        start = time.perf_counter()
+
+        load_s = 0.0
+        if config.needs_load(request_number, body.get("options", {}).get("num_ctx")) and config.load_ms:
+            load_s = config.load_ms / 1000
+        time.sleep(load_s)
+
+        # an empty prompt (or no messages) only loads the model
+        if not (body.get("messages") if chat else body.get("prompt")):
+            self.send_json(200, {"model": body.get("model"), "done": True, "load_duration": int(load_s * 1e9)})
+            config.keep_loaded(body.get("keep_alive"))
+            return
+
+        # like Ollama, only the tokens after the cached prefix are evaluated and counted
+        prompt_tokens = max(1, (len(prompt) - config.cached_chars(prompt)) // CHARS_PER_TOKEN)
+        prompt_s = prompt_tokens / config.prompt_rate
+        time.sleep(prompt_s)
+
+        completion_tokens = max(1, int(random.gauss(config.tokens_mean, config.tokens_stdev)))
+        token_rate = config.token_rate * random.lognormvariate(0, config.token_rate_sigma)
+        words = build_answer(user_text(body, chat), completion_tokens, random.random() < config.refusal_rate)
+        per_token_s = 1 / token_rate
+
+        def message(text: str):
+            if chat:
+                return {"message": {"role": "assistant", "content": text}}
+            return {"response": text}
+
+        def stats(eval_s: float) -> dict:
+            return {
+                "model": body.get("model"),
+                "done": True,
+                "load_duration": int(load_s * 1e9),
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prompt_s * 1e9),
+                "eval_count": len(words),
+                "eval_duration": int(eval_s * 1e9),
+                "total_duration": int((time.perf_counter() - start) * 1e9)
+            }
+
+        if not body.get("stream", True):
+            eval_start = time.perf_counter()
+            time.sleep(per_token_s * len(words))
+            self.send_json(200, {**message(" ".join(words)), **stats(time.perf_counter() - eval_start)})
+            config.keep_loaded(body.get("keep_alive"))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_chunk(payload: dict):
+            data = json.dumps(payload).encode() + b"\n"
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        eval_start = time.perf_counter()
+        for i, word in enumerate(words):
+            time.sleep(per_token_s)
+            send_chunk({**message(word if i == 0 else f" {word}"), "done": False})
+        send_chunk({**message(""), **stats(time.perf_counter() - eval_start)})
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+        config.keep_loaded(body.get("keep_alive"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Ollama generate/chat API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--load-ms", type=float, default=0.0,
+                        help="Model load time, paid when the model is not loaded or num_ctx changes")
+    parser.add_argument("--load-every", type=int, default=0, help="Also reload every N requests (0 = never)")
+    parser.add_argument("--no-prefix-cache", action="store_true",
+                        help="Evaluate the whole prompt every time instead of reusing a cached prefix")
+    parser.add_argument("--prompt-rate", type=float, default=500.0, help="Prompt tokens evaluated per second")
+    parser.add_argument("--tokens-mean", type=float, default=60.0, help="Mean completion length in tokens")
+    parser.add_argument("--tokens-stdev", type=float, default=20.0)
+    parser.add_argument("--token-rate", type=float, default=30.0, help="Median completion tokens per second")
+    parser.add_argument("--token-rate-sigma", type=float, default=0.2, help="Lognormal spread of the token rate")
+    parser.add_argument("--max-parallel", type=int, default=1, help="Requests generated at once, like OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--refusal-rate", type=float, default=0.0, help="Fraction of answers that are the refusal sentence")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Fraction of requests that hang before generating")
+    parser.add_argument("--stall-ms", type=float, default=5000.0, help="How long a stalled request hangs")
+    args = parser.parse_args()
+
+    MockOllamaHandler.config = MockConfig(args)
+    server = ThreadingHTTPServer((args.host, args.port), MockOllamaHandler)
+
+    print(f"Mock Ollama listening on http://{args.host}:{args.port}")
+    print(f"Start the API with VERIFAI_OLLAMA_URL=http://{args.host}:{args.port}/api/generate "
+          f"(or list several mocks in VERIFAI_OLLAMA_BACKENDS)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,15 @@
-from sentence_transformers import SentenceTransformer
 import chromadb
+from app.retrieval.embedding_backend import load_embedder
+from app.retrieval.embedding_cache import EmbeddingCache
 
 CHROMA_DIR = "chroma_db"
 COLLECTION_NAME = "intern_policies"
 
 TOP_K = 2
 
-# Load embedding model (same as ingestion)
-model = SentenceTransformer("all-MiniLM-L6-v2")
+# Load embedding model (same backend as ingestion)
+model = load_embedder()
+embedding_cache = EmbeddingCache(model.name)
 
 
 def main():
@@ -23,7 +25,7 @@ def main():
             break
 
         print("\nEmbedding query...")
-        query_embedding = model.encode(query).tolist()
+        query_embedding = embedding_cache.encode([query], model.encode)[0].tolist()
 
         print("Retrieving top chunks...\n")
 